@@ -2,11 +2,17 @@
 
 import asyncio
 import csv
-import json
+import hashlib
+import orjson
+import time
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, Any, Optional
+import numpy as np
 import pandas as pd
+import pyarrow.compute as pc
+from pyarrow import csv as pa_csv
 import matplotlib.pyplot as plt
 import seaborn as sns
 from tqdm.asyncio import tqdm
@@ -14,22 +20,71 @@ from tqdm.asyncio import tqdm
 from ..utils.tensorzero_client import TensorZeroClient
 from ..langgraph.app import GrammarlySupportChatBot
 
+# Apply the plot style once at import rather than on every chart render
+plt.style.use('seaborn-v0_8-darkgrid')
+
+# Scores recorded for a query whose evaluation raised
+FAILED_OUTCOME = {
+    "success": False,
+    "intent_correct": False,
+    "predicted_intent": None,
+    "has_valid_response": False,
+    "response_length": 0,
+    "escalation_correct": False,
+    "requires_human": True,
+    "quality_score": 0.0
+}
+
+# Dataset columns evaluation reads; the rest of the CSV is never parsed
+DATASET_COLUMNS = ['split', 'customer_query', 'intent', 'ideal_response', 'conversation_id']
+
+
+def read_test_split(dataset_path: Path) -> pd.DataFrame:
+    """Read the test split of the dataset with Arrow's multi-threaded CSV reader."""
+    table = pa_csv.read_csv(
+        dataset_path,
+        # Ideal responses are quoted multi-line cells ("...\n\n[ACTIONS] ...")
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(include_columns=DATASET_COLUMNS)
+    )
+    # Filter before converting so pandas only ever sees test rows
+    return table.filter(pc.equal(table['split'], 'test')).to_pandas()
+
+
+@lru_cache(maxsize=None)
+def get_chatbot() -> GrammarlySupportChatBot:
+    """Build the chatbot (and compile its graph) once per process."""
+    return GrammarlySupportChatBot()
+
 
 class VariantEvaluator:
     """Evaluate different variants of the chatbot."""
     
-    def __init__(self, dataset_path: str = "../data/processed/grammarly_support_dataset.csv"):
+    def __init__(
+        self,
+        dataset_path: str = "../data/processed/grammarly_support_dataset.csv",
+        concurrency: int = 5,
+        use_cache: bool = False,
+        results_path: str = "../data/results/raw_results.jsonl"
+    ):
         self.dataset_path = Path(dataset_path)
-        self.results = []
+        self.concurrency = concurrency
+        self.use_cache = use_cache
+        # Per-query results are streamed here as they complete rather than held in memory
+        self.results_path = Path(results_path)
+        self.total_samples = 0
+        self._test_df: Optional[pd.DataFrame] = None
+        # Bot responses keyed by (variant, md5(query)); opt-in, cached answers carry no latency
+        self._response_cache: Dict[tuple, Dict[str, Any]] = {}
         self.client = TensorZeroClient()
-        self.bot = GrammarlySupportChatBot()
+        self.bot = get_chatbot()
     
     async def load_test_data(self) -> pd.DataFrame:
         """Load test dataset."""
-        df = pd.read_csv(self.dataset_path)
-        # Use only test split for evaluation
-        test_df = df[df['split'] == 'test']
-        return test_df
+        if self._test_df is None:
+            # Use only test split for evaluation
+            self._test_df = read_test_split(self.dataset_path)
+        return self._test_df
     
     async def evaluate_single_query(
         self,
@@ -40,17 +95,22 @@ class VariantEvaluator:
         episode_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """Evaluate a single query."""
-        start_time = datetime.utcnow()
+        start_time = time.perf_counter()
+        cached = False
         
         try:
-            # Process query through the chatbot
-            result = await self.bot.process_query(
-                query=query,
-                episode_id=episode_id
-            )
+            # Process query through the chatbot, reusing earlier answers when cached
+            cache_key = (variant, hashlib.md5(query.encode()).hexdigest())
+            result = self._response_cache.get(cache_key) if self.use_cache else None
+            cached = result is not None
             
-            end_time = datetime.utcnow()
-            latency = (end_time - start_time).total_seconds()
+            if result is None:
+                result = await self.bot.process_query(
+                    query=query,
+                    episode_id=episode_id
+                )
+                if self.use_cache:
+                    self._response_cache[cache_key] = result
             
             # Evaluate intent accuracy
             intent_correct = result.get("intent") == expected_intent
@@ -64,13 +124,10 @@ class VariantEvaluator:
             actual_escalation = result.get("requires_human", False)
             escalation_correct = expected_escalation == actual_escalation
             
-            return {
+            outcome = {
                 "success": True,
-                "variant": variant,
-                "latency": latency,
                 "intent_correct": intent_correct,
                 "predicted_intent": result.get("intent"),
-                "expected_intent": expected_intent,
                 "has_valid_response": has_response,
                 "response_length": response_length,
                 "escalation_correct": escalation_correct,
@@ -80,52 +137,51 @@ class VariantEvaluator:
             }
             
         except Exception as e:
-            end_time = datetime.utcnow()
-            latency = (end_time - start_time).total_seconds()
-            
-            return {
-                "success": False,
-                "variant": variant,
-                "latency": latency,
-                "intent_correct": False,
-                "predicted_intent": None,
-                "expected_intent": expected_intent,
-                "has_valid_response": False,
-                "response_length": 0,
-                "escalation_correct": False,
-                "requires_human": True,
-                "quality_score": 0.0,
-                "error": str(e)
-            }
+            outcome = {**FAILED_OUTCOME, "error": str(e)}
+        
+        return {
+            "variant": variant,
+            # A cache hit never reached the variant, so it has no latency to report; mean/p95 skip the nulls
+            "latency": None if cached else time.perf_counter() - start_time,
+            "cached": cached,
+            "expected_intent": expected_intent,
+            **outcome
+        }
     
-    async def evaluate_variant(self, variant_name: str, test_df: pd.DataFrame) -> List[Dict[str, Any]]:
-        """Evaluate a specific variant."""
+    async def evaluate_variant(self, variant_name: str, test_df: pd.DataFrame, out) -> int:
+        """Evaluate a specific variant, writing each result to `out` as JSON Lines."""
         print(f"\nEvaluating variant: {variant_name}")
         
-        results = []
+        written = 0
         tasks = []
         
-        for _, row in test_df.iterrows():
-            episode_id = f"eval_{variant_name}_{row['conversation_id']}"
+        # Keep up to `concurrency` queries in flight instead of batch-then-sleep
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def bounded(coro):
+            async with semaphore:
+                return await coro
+        
+        # Pull the needed columns out once rather than boxing every row into a Series
+        columns = test_df[['customer_query', 'intent', 'ideal_response', 'conversation_id']].to_numpy()
+        
+        for query, intent, ideal_response, conversation_id in columns:
+            episode_id = f"eval_{variant_name}_{conversation_id}"
             
             task = self.evaluate_single_query(
-                query=row['customer_query'],
-                expected_intent=row['intent'],
-                expected_response=row['ideal_response'],
+                query=query,
+                expected_intent=intent,
+                expected_response=ideal_response,
                 variant=variant_name,
                 episode_id=episode_id
             )
-            tasks.append(task)
+            tasks.append(bounded(task))
         
-        # Process in batches
-        batch_size = 5
-        for i in tqdm(range(0, len(tasks), batch_size), desc=f"Evaluating {variant_name}"):
-            batch = tasks[i:i + batch_size]
-            batch_results = await asyncio.gather(*batch)
-            results.extend(batch_results)
-            await asyncio.sleep(0.5)  # Rate limiting
+        for next_result in tqdm.as_completed(tasks, total=len(tasks), desc=f"Evaluating {variant_name}"):
+            out.write(orjson.dumps(await next_result, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n")
+            written += 1
         
-        return results
+        return written
     
     async def evaluate_all_variants(self):
         """Evaluate all configured variants."""
@@ -140,40 +196,44 @@ class VariantEvaluator:
             # "gpt_4o_mini_fine_tuned"  # Uncomment when fine-tuned model is ready
         ]
         
-        all_results = []
+        self.results_path.parent.mkdir(parents=True, exist_ok=True)
+        self.total_samples = 0
         
-        for variant in variants:
-            variant_results = await self.evaluate_variant(variant, test_df)
-            for result in variant_results:
-                result['variant'] = variant
-            all_results.extend(variant_results)
+        # Truncated per run: calculate_metrics reads the whole file as this run's results,
+        # so appending would mix earlier runs into the metrics
+        with open(self.results_path, 'wb') as out:
+            for variant in variants:
+                self.total_samples += await self.evaluate_variant(variant, test_df, out)
+                out.flush()
         
-        self.results = all_results
-        return all_results
+        return self.results_path
     
     def calculate_metrics(self) -> pd.DataFrame:
         """Calculate evaluation metrics for each variant."""
-        df = pd.DataFrame(self.results)
+        df = pd.read_json(self.results_path, lines=True)
         
-        metrics = []
-        for variant in df['variant'].unique():
-            variant_df = df[df['variant'] == variant]
-            
-            metrics.append({
-                'variant': variant,
-                'success_rate': variant_df['success'].mean(),
-                'intent_accuracy': variant_df['intent_correct'].mean(),
-                'response_validity': variant_df['has_valid_response'].mean(),
-                'escalation_accuracy': variant_df['escalation_correct'].mean(),
-                'avg_quality_score': variant_df['quality_score'].mean(),
-                'avg_latency': variant_df['latency'].mean(),
-                'p95_latency': variant_df['latency'].quantile(0.95),
-                'error_rate': (variant_df['error'].notna()).mean(),
-                'human_escalation_rate': variant_df['requires_human'].mean(),
-                'avg_response_length': variant_df['response_length'].mean()
-            })
-        
-        return pd.DataFrame(metrics)
+        # One grouped pass instead of re-filtering the frame per variant
+        grouped = df.assign(has_error=df['error'].notna()).groupby('variant', sort=False)
+        metrics = grouped.agg(
+            success_rate=('success', 'mean'),
+            intent_accuracy=('intent_correct', 'mean'),
+            response_validity=('has_valid_response', 'mean'),
+            escalation_accuracy=('escalation_correct', 'mean'),
+            avg_quality_score=('quality_score', 'mean'),
+            avg_latency=('latency', 'mean'),
+            error_rate=('has_error', 'mean'),
+            human_escalation_rate=('requires_human', 'mean'),
+            avg_response_length=('response_length', 'mean')
+        )
+        
+        # GroupBy.quantile runs in Cython; a lambda in agg() would call back into Python per group
+        metrics.insert(
+            metrics.columns.get_loc('avg_latency') + 1,
+            'p95_latency',
+            grouped['latency'].quantile(0.95)
+        )
+        
+        return metrics.reset_index()
     
     def generate_visualization(self, output_dir: str = "../data/results"):
         """Generate performance visualization charts."""
@@ -182,60 +242,71 @@ class VariantEvaluator:
         
         metrics_df = self.calculate_metrics()
         
-        # Set up the plot style
-        plt.style.use('seaborn-v0_8-darkgrid')
+        # Pull columns out once; drawing straight onto the axes skips the pandas plot wrapper
+        variants = metrics_df['variant'].to_numpy()
+        x = np.arange(len(variants))
+        
         fig, axes = plt.subplots(2, 2, figsize=(15, 12))
         fig.suptitle('TensorZero Variant Performance Comparison', fontsize=16)
         
         # 1. Intent Accuracy Comparison
         ax1 = axes[0, 0]
-        metrics_df.plot(x='variant', y='intent_accuracy', kind='bar', ax=ax1, color='steelblue')
+        intent_accuracy = metrics_df['intent_accuracy'].to_numpy()
+        ax1.bar(x, intent_accuracy, color='steelblue')
         ax1.set_title('Intent Classification Accuracy')
         ax1.set_ylabel('Accuracy')
         ax1.set_ylim(0, 1.1)
-        ax1.set_xticklabels(metrics_df['variant'], rotation=45, ha='right')
+        ax1.set_xticks(x)
+        ax1.set_xticklabels(variants, rotation=45, ha='right')
         
         # Add value labels on bars
-        for i, v in enumerate(metrics_df['intent_accuracy']):
+        for i, v in enumerate(intent_accuracy):
             ax1.text(i, v + 0.01, f'{v:.2%}', ha='center')
         
         # 2. Response Quality Score
         ax2 = axes[0, 1]
-        metrics_df.plot(x='variant', y='avg_quality_score', kind='bar', ax=ax2, color='darkorange')
+        quality_scores = metrics_df['avg_quality_score'].to_numpy()
+        ax2.bar(x, quality_scores, color='darkorange')
         ax2.set_title('Average Response Quality Score')
         ax2.set_ylabel('Quality Score')
         ax2.set_ylim(0, 1.1)
-        ax2.set_xticklabels(metrics_df['variant'], rotation=45, ha='right')
+        ax2.set_xticks(x)
+        ax2.set_xticklabels(variants, rotation=45, ha='right')
         
-        for i, v in enumerate(metrics_df['avg_quality_score']):
+        for i, v in enumerate(quality_scores):
             ax2.text(i, v + 0.01, f'{v:.2f}', ha='center')
         
         # 3. Latency Comparison
         ax3 = axes[1, 0]
-        x = range(len(metrics_df))
         width = 0.35
-        ax3.bar([i - width/2 for i in x], metrics_df['avg_latency'], width, label='Avg Latency', color='lightgreen')
-        ax3.bar([i + width/2 for i in x], metrics_df['p95_latency'], width, label='P95 Latency', color='salmon')
+        ax3.bar(x - width/2, metrics_df['avg_latency'].to_numpy(), width, label='Avg Latency', color='lightgreen')
+        ax3.bar(x + width/2, metrics_df['p95_latency'].to_numpy(), width, label='P95 Latency', color='salmon')
         ax3.set_title('Response Latency')
         ax3.set_ylabel('Latency (seconds)')
         ax3.set_xticks(x)
-        ax3.set_xticklabels(metrics_df['variant'], rotation=45, ha='right')
+        ax3.set_xticklabels(variants, rotation=45, ha='right')
         ax3.legend()
         
         # 4. Success Metrics
         ax4 = axes[1, 1]
-        success_metrics = ['success_rate', 'response_validity', 'escalation_accuracy']
-        metrics_subset = metrics_df[['variant'] + success_metrics]
-        metrics_subset.set_index('variant').plot(kind='bar', ax=ax4)
+        success_metrics = {
+            'success_rate': 'Success Rate',
+            'response_validity': 'Valid Response',
+            'escalation_accuracy': 'Escalation Accuracy'
+        }
+        width = 0.25
+        for offset, (column, label) in zip((-width, 0, width), success_metrics.items()):
+            ax4.bar(x + offset, metrics_df[column].to_numpy(), width, label=label)
         ax4.set_title('Success Metrics Comparison')
         ax4.set_ylabel('Rate')
         ax4.set_ylim(0, 1.1)
-        ax4.set_xticklabels(metrics_df['variant'], rotation=45, ha='right')
-        ax4.legend(['Success Rate', 'Valid Response', 'Escalation Accuracy'])
+        ax4.set_xticks(x)
+        ax4.set_xticklabels(variants, rotation=45, ha='right')
+        ax4.legend()
         
-        plt.tight_layout()
-        plt.savefig(output_path / 'variant_comparison.png', dpi=300, bbox_inches='tight')
-        plt.close()
+        fig.tight_layout()
+        fig.savefig(output_path / 'variant_comparison.png', dpi=300, bbox_inches='tight')
+        plt.close(fig)
         
         # Save metrics to CSV
         metrics_df.to_csv(output_path / 'evaluation_metrics.csv', index=False)
@@ -249,29 +320,29 @@ class VariantEvaluator:
         """Generate detailed evaluation report."""
         report = {
             "evaluation_date": datetime.utcnow().isoformat(),
-            "total_samples_evaluated": len(self.results),
+            "total_samples_evaluated": self.total_samples,
             "variants_tested": metrics_df['variant'].tolist(),
             "summary": {},
             "recommendations": []
         }
         
-        # Find best variant for each metric
-        best_intent = metrics_df.loc[metrics_df['intent_accuracy'].idxmax(), 'variant']
-        best_quality = metrics_df.loc[metrics_df['avg_quality_score'].idxmax(), 'variant']
-        best_latency = metrics_df.loc[metrics_df['avg_latency'].idxmin(), 'variant']
+        # Find best variant for each metric; one scalar lookup per row label
+        best_intent_idx = metrics_df['intent_accuracy'].idxmax()
+        best_quality_idx = metrics_df['avg_quality_score'].idxmax()
+        best_latency_idx = metrics_df['avg_latency'].idxmin()
         
         report["summary"] = {
             "best_intent_accuracy": {
-                "variant": best_intent,
-                "accuracy": float(metrics_df[metrics_df['variant'] == best_intent]['intent_accuracy'].values[0])
+                "variant": metrics_df.at[best_intent_idx, 'variant'],
+                "accuracy": metrics_df.at[best_intent_idx, 'intent_accuracy']
             },
             "best_quality_score": {
-                "variant": best_quality,
-                "score": float(metrics_df[metrics_df['variant'] == best_quality]['avg_quality_score'].values[0])
+                "variant": metrics_df.at[best_quality_idx, 'variant'],
+                "score": metrics_df.at[best_quality_idx, 'avg_quality_score']
             },
             "best_latency": {
-                "variant": best_latency,
-                "latency": float(metrics_df[metrics_df['variant'] == best_latency]['avg_latency'].values[0])
+                "variant": metrics_df.at[best_latency_idx, 'variant'],
+                "latency": metrics_df.at[best_latency_idx, 'avg_latency']
             }
         }
         
@@ -286,9 +357,9 @@ class VariantEvaluator:
                     f"DICL improves intent accuracy by {improvement:.1f}% over base GPT-4o-mini"
                 )
         
-        # Save report
-        with open(output_path / 'evaluation_report.json', 'w') as f:
-            json.dump(report, f, indent=2)
+        # Save report; orjson serializes the numpy scalars pulled from metrics_df natively
+        with open(output_path / 'evaluation_report.json', 'wb') as f:
+            f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
 
 
 async def main():
@@ -2,12 +2,14 @@
 """Export ClickHouse database for TensorZero to portable format."""
 
 import os
-import json
 import clickhouse_connect
+from clickhouse_connect.driver.httputil import get_pool_manager
 from datetime import datetime
 import subprocess
 import tarfile
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # ClickHouse connection settings
 CLICKHOUSE_HOST = 'localhost'
@@ -19,6 +21,19 @@ CLICKHOUSE_DATABASE = 'tensorzero'
 # Export directory
 EXPORT_DIR = f'clickhouse_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
 
+# Tables are exported concurrently; clients are not thread-safe, so each worker gets its own
+MAX_EXPORT_WORKERS = 8
+_thread_local = threading.local()
+_print_lock = threading.Lock()
+
+# One HTTP connection pool shared by every worker's client, so connections are reused across tables
+_pool_manager = get_pool_manager(maxsize=MAX_EXPORT_WORKERS)
+
+def log(message=""):
+    """Print a progress line without interleaving output from worker threads."""
+    with _print_lock:
+        print(message)
+
 def get_clickhouse_client():
     """Create ClickHouse client connection."""
     return clickhouse_connect.get_client(
@@ -26,9 +41,18 @@ def get_clickhouse_client():
         port=CLICKHOUSE_PORT,
         username=CLICKHOUSE_USER,
         password=CLICKHOUSE_PASSWORD,
-        database=CLICKHOUSE_DATABASE
+        database=CLICKHOUSE_DATABASE,
+        compress='lz4',
+        pool_mgr=_pool_manager,
+        settings={'max_execution_time': 0}
     )
 
+def get_thread_client():
+    """Return the ClickHouse client owned by the current worker thread."""
+    if not hasattr(_thread_local, 'client'):
+        _thread_local.client = get_clickhouse_client()
+    return _thread_local.client
+
 def export_table_schema(client, table_name, export_path):
     """Export table schema (CREATE TABLE statement)."""
     result = client.command(f"SHOW CREATE TABLE {table_name}")
@@ -37,82 +61,81 @@ def export_table_schema(client, table_name, export_path):
     with open(schema_file, 'w') as f:
         f.write(result + ";\n")
     
-    print(f"  ✓ Exported schema for {table_name}")
+    log(f"  ✓ Exported schema for {table_name}")
 
 def export_table_data(client, table_name, export_path):
-    """Export table data to CSV format."""
-    csv_file = os.path.join(export_path, f"{table_name}_data.csv")
-    
-    # Get row count first
-    count_result = client.query(f"SELECT COUNT(*) FROM {table_name}")
-    row_count = count_result.result_rows[0][0] if count_result.result_rows else 0
+    """Export table data in ClickHouse Native (binary, columnar) format."""
+    native_file = os.path.join(export_path, f"{table_name}_data.native")
     
-    if row_count == 0:
-        print(f"  ⚠ Table {table_name} is empty, skipping data export")
-        return
+    # Native keeps Array/Map/Tuple columns intact and skips text encoding entirely
+    query = f"SELECT * FROM {table_name}"
     
-    # Export to CSV using ClickHouse native format
-    query = f"SELECT * FROM {table_name} FORMAT CSVWithNames"
+    # Written under a temporary name and renamed on success, so a failed stream never
+    # leaves a truncated .native file for the importer to pick up
+    tmp_file = native_file + '.tmp'
     
     try:
-        # Use command-line client for better performance with large datasets
-        cmd = [
-            'docker', 'exec', 'grammarly-tz-clickhouse-1',
-            'clickhouse-client',
-            '--user', CLICKHOUSE_USER,
-            '--password', CLICKHOUSE_PASSWORD,
-            '--database', CLICKHOUSE_DATABASE,
-            '--query', query
-        ]
+        # Stream the response body over the client's HTTP connection instead of
+        # spawning clickhouse-client inside the container and piping its stdout
+        with client.raw_stream(query, fmt='Native') as stream, open(tmp_file, 'wb') as f:
+            shutil.copyfileobj(stream, f, length=1024 * 1024)
         
-        with open(csv_file, 'w') as f:
-            subprocess.run(cmd, stdout=f, check=True)
+        # An empty table produces no Native blocks, so there is no need for a COUNT(*) probe
+        file_size = os.path.getsize(tmp_file)
+        if file_size == 0:
+            os.remove(tmp_file)
+            log(f"  ⚠ Table {table_name} is empty, skipping data export")
+            return
         
-        print(f"  ✓ Exported {row_count:,} rows from {table_name}")
-    except subprocess.CalledProcessError as e:
-        print(f"  ✗ Error exporting {table_name}: {e}")
-
-def export_table_data_json(client, table_name, export_path):
-    """Export table data to JSON format for tables with complex types."""
-    json_file = os.path.join(export_path, f"{table_name}_data.json")
+        os.replace(tmp_file, native_file)
+        log(f"  ✓ Exported {file_size / (1024 * 1024):.2f} MB from {table_name}")
+    except Exception as e:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        log(f"  ✗ Error exporting {table_name}: {e}")
+
+def export_table(table_name):
+    """Export schema and data for a single table on the current worker thread."""
+    client = get_thread_client()
+    log(f"Exporting {table_name}...")
     
-    # Tables with complex types that need JSON export
-    complex_tables = ['DynamicInContextLearningExample', 'JsonInference', 'ChatInference']
+    # Export schema
+    export_table_schema(client, table_name, EXPORT_DIR)
     
-    if table_name not in complex_tables:
-        return
+    # Export data
+    export_table_data(client, table_name, EXPORT_DIR)
+
+SCHEMA_IMPORT_TEMPLATE = """
+if [ -f "{table}_schema.sql" ]; then
+    echo "Creating table {table}..."
+    execute_query "$(cat {table}_schema.sql)"
+fi
+"""
+
+DATA_IMPORT_HEADER = """
+# Import data
+echo ""
+echo "Importing data..."
+"""
+
+def write_import_script(export_path, filename, header, footer, tables):
+    """Assemble an import script from its shell preamble and per-table steps."""
+    parts = [header]
+    parts.extend(SCHEMA_IMPORT_TEMPLATE.format(table=table) for table in tables)
+    parts.append(DATA_IMPORT_HEADER)
+    parts.extend(f'import_native "{table}" "{table}_data.native"\n' for table in tables)
+    parts.append(footer)
     
-    try:
-        # Get all data
-        result = client.query(f"SELECT * FROM {table_name}")
-        
-        # Convert to list of dicts
-        columns = [col[0] for col in result.column_descriptions]
-        data = []
-        
-        for row in result.result_rows:
-            row_dict = {}
-            for i, value in enumerate(row):
-                # Handle special types
-                if isinstance(value, bytes):
-                    row_dict[columns[i]] = value.hex()
-                elif isinstance(value, (list, dict)):
-                    row_dict[columns[i]] = value
-                else:
-                    row_dict[columns[i]] = str(value) if value is not None else None
-            data.append(row_dict)
-        
-        # Write to JSON
-        with open(json_file, 'w') as f:
-            json.dump(data, f, indent=2, default=str)
-        
-        print(f"  ✓ Exported {len(data):,} rows from {table_name} to JSON")
-    except Exception as e:
-        print(f"  ⚠ Could not export {table_name} to JSON: {e}")
+    script_file = os.path.join(export_path, filename)
+    with open(script_file, 'w') as f:
+        f.write(''.join(parts))
+    
+    os.chmod(script_file, 0o755)
+    return script_file
 
 def create_import_script(export_path, tables):
     """Create a script to import the data on another machine."""
-    import_script = """#!/bin/bash
+    header = """#!/bin/bash
 # Import ClickHouse data exported by export_clickhouse_data.py
 
 set -e
@@ -139,8 +162,8 @@ execute_query() {
         --query "$1"
 }
 
-# Function to import CSV file
-import_csv() {
+# Function to import Native data file
+import_native() {
     local table=$1
     local file=$2
     
@@ -152,7 +175,7 @@ import_csv() {
             --user "$CLICKHOUSE_USER" \\
             --password "$CLICKHOUSE_PASSWORD" \\
             --database "$CLICKHOUSE_DATABASE" \\
-            --query "INSERT INTO $table FORMAT CSVWithNames" < "$file"
+            --query "INSERT INTO $table FORMAT Native" < "$file"
         echo "✓ Imported $table"
     fi
 }
@@ -171,26 +194,7 @@ echo ""
 echo "Creating tables..."
 """
 
-    # Add schema imports
-    for table in tables:
-        import_script += f"""
-if [ -f "{table}_schema.sql" ]; then
-    echo "Creating table {table}..."
-    execute_query "$(cat {table}_schema.sql)"
-fi
-"""
-
-    import_script += """
-# Import data
-echo ""
-echo "Importing data..."
-"""
-
-    # Add data imports
-    for table in tables:
-        import_script += f'import_csv "{table}" "{table}_data.csv"\n'
-
-    import_script += """
+    footer = """
 echo ""
 echo "Import completed!"
 echo ""
@@ -198,16 +202,12 @@ echo "Verify with:"
 echo "  clickhouse-client --query 'SHOW TABLES FROM $CLICKHOUSE_DATABASE'"
 """
 
-    script_file = os.path.join(export_path, 'import_data.sh')
-    with open(script_file, 'w') as f:
-        f.write(import_script)
-    
-    os.chmod(script_file, 0o755)
+    script_file = write_import_script(export_path, 'import_data.sh', header, footer, tables)
     print(f"  ✓ Created import script: {script_file}")
 
 def create_docker_import_script(export_path, tables):
     """Create a script to import data using Docker."""
-    docker_script = """#!/bin/bash
+    header = """#!/bin/bash
 # Import ClickHouse data using Docker
 
 set -e
@@ -231,8 +231,8 @@ execute_query() {
         --query "$1"
 }
 
-# Function to import CSV file via Docker
-import_csv() {
+# Function to import Native data file via Docker
+import_native() {
     local table=$1
     local file=$2
     
@@ -242,7 +242,7 @@ import_csv() {
             --user "$CLICKHOUSE_USER" \\
             --password "$CLICKHOUSE_PASSWORD" \\
             --database "$CLICKHOUSE_DATABASE" \\
-            --query "INSERT INTO $table FORMAT CSVWithNames" < "$file"
+            --query "INSERT INTO $table FORMAT Native" < "$file"
         echo "✓ Imported $table"
     fi
 }
@@ -259,26 +259,7 @@ echo ""
 echo "Creating tables..."
 """
 
-    # Add schema imports
-    for table in tables:
-        docker_script += f"""
-if [ -f "{table}_schema.sql" ]; then
-    echo "Creating table {table}..."
-    execute_query "$(cat {table}_schema.sql)"
-fi
-"""
-
-    docker_script += """
-# Import data
-echo ""
-echo "Importing data..."
-"""
-
-    # Add data imports
-    for table in tables:
-        docker_script += f'import_csv "{table}" "{table}_data.csv"\n'
-
-    docker_script += """
+    footer = """
 echo ""
 echo "Import completed!"
 echo ""
@@ -286,13 +267,26 @@ echo "Verify with:"
 echo "  docker exec $CONTAINER_NAME clickhouse-client --query 'SHOW TABLES FROM $CLICKHOUSE_DATABASE'"
 """
 
-    script_file = os.path.join(export_path, 'import_data_docker.sh')
-    with open(script_file, 'w') as f:
-        f.write(docker_script)
-    
-    os.chmod(script_file, 0o755)
+    script_file = write_import_script(export_path, 'import_data_docker.sh', header, footer, tables)
     print(f"  ✓ Created Docker import script: {script_file}")
 
+def create_archive(source_dir, tar_filename):
+    """Create a .tar.gz archive, compressing on all cores with pigz when available."""
+    pigz = shutil.which('pigz')
+    if pigz:
+        cmd = [
+            'tar', '-I', f"{pigz} -p {os.cpu_count() or 1}",
+            '-cf', tar_filename,
+            '-C', os.path.dirname(os.path.abspath(source_dir)),
+            os.path.basename(source_dir)
+        ]
+        subprocess.run(cmd, check=True)
+        return
+    
+    # Fall back to single-threaded zlib
+    with tarfile.open(tar_filename, "w:gz") as tar:
+        tar.add(source_dir, arcname=os.path.basename(source_dir))
+
 def main():
     """Main export function."""
     print(f"ClickHouse Data Export Tool")
@@ -316,20 +310,16 @@ def main():
     print(f"Found {len(tables)} tables to export")
     print()
     
-    # Export each table
-    for table in sorted(tables):
-        print(f"Exporting {table}...")
-        
-        # Export schema
-        export_table_schema(client, table, EXPORT_DIR)
-        
-        # Export data
-        export_table_data(client, table, EXPORT_DIR)
-        
-        # Export complex tables to JSON as well
-        export_table_data_json(client, table, EXPORT_DIR)
-        
-        print()
+    # Export tables concurrently; each export is bound on ClickHouse and disk I/O
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_EXPORT_WORKERS, len(tables)))) as executor:
+        futures = {executor.submit(export_table, table): table for table in sorted(tables)}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                log(f"  ✗ Error exporting {futures[future]}: {e}")
+    
+    print()
     
     # Create import scripts
     print("Creating import scripts...")
@@ -349,8 +339,7 @@ This export was created on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
 ## Contents
 - *_schema.sql: Table schemas (CREATE TABLE statements)
-- *_data.csv: Table data in CSV format
-- *_data.json: Table data in JSON format (for complex types)
+- *_data.native: Table data in ClickHouse Native format
 - import_data.sh: Script to import data using native ClickHouse client
 - import_data_docker.sh: Script to import data using Docker
 
@@ -387,8 +376,7 @@ CLICKHOUSE_HOST=newhost CLICKHOUSE_PORT=9000 ./import_data.sh
     print()
     print("Creating archive...")
     tar_filename = f"{EXPORT_DIR}.tar.gz"
-    with tarfile.open(tar_filename, "w:gz") as tar:
-        tar.add(EXPORT_DIR, arcname=os.path.basename(EXPORT_DIR))
+    create_archive(EXPORT_DIR, tar_filename)
     
     print(f"  ✓ Created archive: {tar_filename}")
     
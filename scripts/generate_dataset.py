@@ -1,23 +1,162 @@
 """Generate synthetic customer support dataset for training and evaluation."""
 
-import json
+import hashlib
 import random
+import re
 import csv
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any
 import asyncio
-from openai import AsyncOpenAI
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+
+# Settings shared by real-time and Batch API response generation
+RESPONSE_MODEL = "gpt-4o-mini"
+RESPONSE_TEMPERATURE = 0.7
+
+# Temperature is annealed across a run so later responses drift away from earlier ones
+TEMPERATURE_START = 0.3
+TEMPERATURE_END = 1.1
+
+# Earlier responses shown to the model as examples not to copy
+RECENT_RESPONSES_KEPT = 50
+AVOID_EXAMPLES_PER_PROMPT = 3
+RESPONSE_MAX_TOKENS = 500
+
+# Queries answered per real-time request; the shared instructions are sent once per group
+RESPONSES_PER_REQUEST = 20
+
+RESPONSE_REQUIREMENTS = """Requirements:
+1. Be empathetic and acknowledge their issue
+2. Provide clear, actionable steps to resolve the problem
+3. Use information from the relevant help articles when available
+4. Offer alternatives if the primary solution might not work
+5. Be concise but thorough
+6. End with next steps or additional resources
+7. Set escalate to true only if the issue requires human support
+8. Put any specific actions you suggest in actions, one step per item"""
+
+# Structured output for ideal responses, so escalation and actions arrive as typed fields
+IDEAL_RESPONSE_PROPERTIES = {
+    "response": {"type": "string"},
+    "escalate": {"type": "boolean"},
+    "actions": {"type": "array", "items": {"type": "string"}}
+}
+IDEAL_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "support_response",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": IDEAL_RESPONSE_PROPERTIES,
+            "required": list(IDEAL_RESPONSE_PROPERTIES),
+            "additionalProperties": False
+        }
+    }
+}
+GROUPED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "support_responses",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "responses": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"id": {"type": "integer"}, **IDEAL_RESPONSE_PROPERTIES},
+                        "required": ["id", *IDEAL_RESPONSE_PROPERTIES],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["responses"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# Terms recognised by extract_entities
+ENTITY_TERMS = {
+    "product": ["grammarly free", "grammarly premium", "grammarly business",
+                "browser extension", "desktop app", "mobile app"],
+    "platform": ["chrome", "firefox", "safari", "edge", "windows", "mac",
+                 "ios", "android", "google docs", "microsoft word"],
+    "feature": ["tone detector", "plagiarism", "vocabulary", "clarity", "citation"]
+}
+
+# Longest terms first so multi-word names win over any shorter term they contain
+ENTITY_PATTERN = re.compile("|".join(
+    re.escape(term)
+    for term in sorted((t for terms in ENTITY_TERMS.values() for t in terms), key=len, reverse=True)
+))
+ERROR_CODE_PATTERN = re.compile(r'error \d+|code \d+|err_\w+')
+
+# Query template placeholders such as {platform}
+PLACEHOLDER_PATTERN = re.compile(r'\{(\w+)\}')
+
+# How often to check on a submitted Batch API job
+BATCH_POLL_INTERVAL = 30
+
+
+class RateLimiter:
+    """Async token bucket allowing `rate` acquisitions per `period` seconds."""
+    
+    def __init__(self, rate: int, period: float = 60.0):
+        self.rate = rate
+        self.period = period
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Wait until a request may be sent."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.period)
+                self.updated = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                await asyncio.sleep((1 - self.tokens) * self.period / self.rate)
 
 
 class DatasetGenerator:
     """Generate synthetic customer support queries and responses."""
     
-    def __init__(self, articles_dir: str = "../data/scraped"):
+    def __init__(
+        self,
+        articles_dir: str = "../data/scraped",
+        max_concurrency: int = 10,
+        requests_per_minute: int = 500
+    ):
         self.articles_dir = Path(articles_dir)
         self.articles = self.load_articles()
         self.client = AsyncOpenAI()
         
+        # Throttle real-time requests to the account's limits instead of fixed sleeps
+        self.request_semaphore = asyncio.Semaphore(max_concurrency)
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        
+        # Ideal responses keyed by response_cache_key, reused for duplicate queries
+        self._response_cache: Dict[str, Dict[str, Any]] = {}
+        self._recent_responses = deque(maxlen=RECENT_RESPONSES_KEPT)
+        
+        # Every row from one generate_dataset run shares that run's start timestamp
+        self._batch_ts = datetime.utcnow().isoformat()
+        
         # Query templates by intent
         self.query_templates = {
             "technical_support": [
@@ -78,67 +217,40 @@ class DatasetGenerator:
             "bug_behavior": ["highlighting everything", "not saving changes", "duplicating suggestions", "showing blank screen"],
             "bug_description": ["suggestions appear behind the text", "the sidebar overlaps with content", "undo doesn't work properly"]
         }
+        
+        # Templates are fixed, so their placeholder names are found once rather than per query
+        self._template_placeholders = {
+            intent: [(template, PLACEHOLDER_PATTERN.findall(template)) for template in templates]
+            for intent, templates in self.query_templates.items()
+        }
     
-    def 3cles(self) -> List[Dict[str, Any]]:
+    def load_articles(self) -> List[Dict[str, Any]]:
         """Load scraped articles."""
-        articles = []
-        for file_path in self.articles_dir.glob("article_*.json"):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                articles.append(json.load(f))
-        return articles
+        paths = list(self.articles_dir.glob("article_*.json"))
+        
+        # Overlap file reads across threads; orjson parses the raw bytes directly
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            return list(executor.map(lambda path: orjson.loads(path.read_bytes()), paths))
     
     def generate_query(self, intent: str) -> str:
         """Generate a query for a given intent."""
-        template = random.choice(self.query_templates.get(intent, []))
-        
-        # Replace variables in template
-        query = template
-        for var_name, var_options in self.variables.items():
-            placeholder = f"{{{var_name}}}"
-            if placeholder in query:
-                query = query.replace(placeholder, random.choice(var_options))
-        
-        return query
+        template, names = random.choice(self._template_placeholders.get(intent, []))
+        return template.format_map({name: random.choice(self.variables[name]) for name in names})
     
     def extract_entities(self, query: str, intent: str) -> Dict[str, List[str]]:
         """Extract entities from a query."""
-        entities = {
-            "product": [],
-            "feature": [],
-            "error_code": [],
-            "platform": []
-        }
-        
         query_lower = query.lower()
         
-        # Extract products
-        products = ["grammarly free", "grammarly premium", "grammarly business", 
-                   "browser extension", "desktop app", "mobile app"]
-        for product in products:
-            if product in query_lower:
-                entities["product"].append(product.replace(" ", "_"))
-        
-        # Extract platforms
-        platforms = ["chrome", "firefox", "safari", "edge", "windows", "mac", 
-                    "ios", "android", "google docs", "microsoft word"]
-        for platform in platforms:
-            if platform in query_lower:
-                entities["platform"].append(platform.replace(" ", "_"))
-        
-        # Extract features
-        features = ["tone detector", "plagiarism", "vocabulary", "clarity", "citation"]
-        for feature in features:
-            if feature in query_lower:
-                entities["feature"].append(feature)
-        
-        # Extract error codes
-        import re
-        error_patterns = [r'error \d+', r'code \d+', r'err_\w+']
-        for pattern in error_patterns:
-            matches = re.findall(pattern, query_lower)
-            entities["error_code"].extend(matches)
-        
-        return entities
+        # One scan finds every known product, platform and feature term;
+        # report them in canonical order, as the per-term checks did
+        found = set(ENTITY_PATTERN.findall(query_lower))
+        
+        return {
+            "product": [term.replace(" ", "_") for term in ENTITY_TERMS["product"] if term in found],
+            "feature": [term for term in ENTITY_TERMS["feature"] if term in found],
+            "error_code": ERROR_CODE_PATTERN.findall(query_lower),
+            "platform": [term.replace(" ", "_") for term in ENTITY_TERMS["platform"] if term in found]
+        }
     
     def determine_urgency(self, intent: str, query: str) -> str:
         """Determine urgency level based on intent and keywords."""
@@ -194,8 +306,8 @@ class DatasetGenerator:
         relevant_articles.sort(key=lambda x: x[0], reverse=True)
         return [article for _, article in relevant_articles[:top_k]]
     
-    async def generate_ideal_response(self, query: str, intent: str, entities: Dict[str, Any]) -> str:
-        """Generate an ideal support response using GPT-4."""
+    def build_query_context(self, query: str, intent: str, entities: Dict[str, Any]) -> str:
+        """Describe a query, its classification and relevant help articles for a prompt."""
         # Find relevant articles
         relevant_articles = self.find_relevant_articles(query, entities)
         
@@ -206,65 +318,266 @@ class DatasetGenerator:
             for i, article in enumerate(relevant_articles, 1):
                 article_context += f"\n{i}. {article['title']}\n{article['content'][:500]}...\n"
         
-        prompt = f"""You are a Grammarly customer support specialist. Generate an ideal response to this customer query.
-
-Query: {query}
+        return f"""Query: {query}
 Intent: {intent}
 Identified Products: {', '.join(entities.get('product', []))}
 Identified Platforms: {', '.join(entities.get('platform', []))}
-{article_context}
+{article_context}"""
+    
+    def build_prompt(self, query: str, intent: str, entities: Dict[str, Any]) -> str:
+        """Build the prompt asking for an ideal support response."""
+        prompt = f"""You are a Grammarly customer support specialist. Generate an ideal response to this customer query.
 
-Requirements:
-1. Be empathetic and acknowledge their issue
-2. Provide clear, actionable steps to resolve the problem
-3. Use information from the relevant help articles when available
-4. Offer alternatives if the primary solution might not work
-5. Be concise but thorough
-6. End with next steps or additional resources
-7. If the issue requires human support, include [ESCALATE] in your response
-8. If you're suggesting specific actions, include them as [ACTIONS] followed by a numbered list
+{self.build_query_context(query, intent, entities)}
+
+{RESPONSE_REQUIREMENTS}
 
-Generate the ideal support response:"""
+Generate the ideal support response as JSON with response, escalate and actions fields:"""
         
-        response = await self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=500
+        return prompt
+    
+    def build_multi_prompt(self, samples: List[Dict[str, Any]]) -> str:
+        """Build one prompt asking for ideal responses to several queries at once."""
+        query_sections = "\n\n".join(
+            f"### Query {i}\n"
+            + self.build_query_context(sample["customer_query"], sample["intent"], sample["entities"])
+            for i, sample in enumerate(samples, 1)
         )
         
-        return response.choices[0].message.content
+        prompt = f"""You are a Grammarly customer support specialist. Generate an ideal response to each of the {len(samples)} customer queries below.
+
+{query_sections}
+
+{RESPONSE_REQUIREMENTS}
+
+Apply these requirements to every response independently.
+Return a JSON object of the form {{"responses": [{{"id": 1, "response": "...", "escalate": false, "actions": ["..."]}}, ...]}} with exactly {len(samples)} items, where id is the query number."""
+        
+        if self._recent_responses:
+            examples = random.sample(
+                list(self._recent_responses),
+                min(AVOID_EXAMPLES_PER_PROMPT, len(self._recent_responses))
+            )
+            prompt += "\n\nPreviously generated responses to AVOID copying in wording or structure:\n"
+            prompt += "\n".join(f"- {example[:300]}..." for example in examples)
+        
+        return prompt
+    
+    @staticmethod
+    def annealed_temperature(progress: float) -> float:
+        """Temperature for a request made `progress` (0-1) of the way through a run."""
+        return TEMPERATURE_START + (TEMPERATURE_END - TEMPERATURE_START) * progress
+    
+    def build_completion_request(
+        self,
+        query: str,
+        intent: str,
+        entities: Dict[str, Any],
+        temperature: float = RESPONSE_TEMPERATURE
+    ) -> Dict[str, Any]:
+        """Build the chat completion parameters for an ideal response."""
+        return {
+            "model": RESPONSE_MODEL,
+            "messages": [{"role": "user", "content": self.build_prompt(query, intent, entities)}],
+            "temperature": temperature,
+            "max_tokens": RESPONSE_MAX_TOKENS,
+            "response_format": IDEAL_RESPONSE_FORMAT
+        }
+    
+    @retry(
+        wait=wait_random_exponential(min=1, max=60),
+        stop=stop_after_attempt(5),
+        retry=retry_if_exception_type((RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)),
+        reraise=True
+    )
+    async def create_chat_completion(self, build_params: Callable[[], Dict[str, Any]]):
+        """Send a chat completion within the concurrency and rate limits, retrying transient errors.
+        
+        Parameters are built only once a request slot is free, so prompts can
+        draw on responses received while the request was waiting.
+        """
+        async with self.request_semaphore:
+            await self.rate_limiter.acquire()
+            return await self.client.chat.completions.create(**build_params())
+    
+    @staticmethod
+    def structured_ideal(item: Dict[str, Any]) -> Dict[str, Any]:
+        """Pick the typed ideal response fields out of a decoded JSON object."""
+        return {
+            "response": str(item["response"]),
+            "escalate": bool(item["escalate"]),
+            "actions": [str(action) for action in item["actions"]]
+        }
+    
+    def parse_ideal_response(self, content: str) -> Dict[str, Any]:
+        """Parse a structured ideal response, keeping unparseable output as plain text."""
+        try:
+            return self.structured_ideal(orjson.loads(content))
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            print("⚠ Could not parse structured response, keeping raw text")
+            return {"response": content or "", "escalate": False, "actions": []}
     
-    async def generate_dataset_entry(self, conversation_id: str, split: str) -> Dict[str, Any]:
-        """Generate a single dataset entry."""
+    @staticmethod
+    def render_ideal_response(ideal: Dict[str, Any]) -> str:
+        """Render a structured ideal response in the dataset's text format."""
+        # Downstream consumers read the [ACTIONS] / [ESCALATE] markers from the text
+        text = ideal["response"]
+        if ideal["actions"]:
+            text += "\n\n[ACTIONS]\n" + "\n".join(f"{i}. {action}" for i, action in enumerate(ideal["actions"], 1))
+        if ideal["escalate"]:
+            text += "\n\n[ESCALATE]"
+        return text
+    
+    async def generate_ideal_response(self, query: str, intent: str, entities: Dict[str, Any]) -> Dict[str, Any]:
+        """Generate an ideal support response using GPT-4."""
+        response = await self.create_chat_completion(
+            lambda: self.build_completion_request(query, intent, entities)
+        )
+        
+        return self.parse_ideal_response(response.choices[0].message.content)
+    
+    def create_sample(self, conversation_id: str, split: str) -> Dict[str, Any]:
+        """Generate the query side of a dataset entry locally, without any API calls."""
         intent = random.choice(list(self.query_templates.keys()))
         query = self.generate_query(intent)
-        entities = self.extract_entities(query, intent)
-        urgency = self.determine_urgency(intent, query)
-        
-        # Generate ideal response
-        ideal_response = await self.generate_ideal_response(query, intent, entities)
-        
-        # Determine if it could be resolved without human
-        resolution_potential = "[ESCALATE]" not in ideal_response
         
         return {
             "conversation_id": conversation_id,
             "split": split,
             "customer_query": query,
             "intent": intent,
+            "entities": self.extract_entities(query, intent),
+            "urgency": self.determine_urgency(intent, query)
+        }
+    
+    def build_entry(self, sample: Dict[str, Any], ideal: Dict[str, Any]) -> Dict[str, Any]:
+        """Combine a sample with its structured ideal response into a dataset row."""
+        return {
+            "conversation_id": sample["conversation_id"],
+            "split": sample["split"],
+            "customer_query": sample["customer_query"],
+            "intent": sample["intent"],
             "confidence": round(random.uniform(0.8, 1.0), 2),
-            "entities": json.dumps(entities),
-            "urgency": urgency,
-            "ideal_response": ideal_response,
-            "resolution_potential": resolution_potential,
-            "timestamp": datetime.utcnow().isoformat()
+            "entities": orjson.dumps(sample["entities"]).decode(),
+            "urgency": sample["urgency"],
+            "ideal_response": self.render_ideal_response(ideal),
+            "resolution_potential": not ideal["escalate"],
+            "timestamp": self._batch_ts
         }
     
-    async def generate_dataset(self, num_samples: int = 500, output_file: str = "../data/processed/grammarly_support_dataset.csv"):
-        """Generate the full dataset."""
+    async def generate_ideal_responses(
+        self,
+        samples: List[Dict[str, Any]],
+        temperature: float = RESPONSE_TEMPERATURE
+    ) -> List[Dict[str, Any]]:
+        """Generate ideal responses for several samples with a single request."""
+        response = await self.create_chat_completion(lambda: {
+            "model": RESPONSE_MODEL,
+            "messages": [{"role": "user", "content": self.build_multi_prompt(samples)}],
+            "temperature": temperature,
+            "max_tokens": RESPONSE_MAX_TOKENS * len(samples),
+            "response_format": GROUPED_RESPONSE_FORMAT
+        })
+        
+        try:
+            items = orjson.loads(response.choices[0].message.content)["responses"]
+            by_id = {int(item["id"]): self.structured_ideal(item) for item in items}
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError):
+            by_id = {}
+        
+        # Ask individually for anything the grouped reply dropped or garbled
+        responses = []
+        for i, sample in enumerate(samples, 1):
+            if i not in by_id:
+                by_id[i] = await self.generate_ideal_response(
+                    sample["customer_query"], sample["intent"], sample["entities"]
+                )
+            responses.append(by_id[i])
+        
+        return responses
+    
+    async def generate_group_responses(self, samples: List[Dict[str, Any]], temperature: float) -> List[tuple]:
+        """Generate ideal responses for a group of samples, paired with their samples."""
+        ideal_responses = await self.generate_ideal_responses(samples, temperature)
+        self._recent_responses.extend(ideal["response"] for ideal in ideal_responses)
+        return list(zip(samples, ideal_responses))
+    
+    @staticmethod
+    def response_cache_key(sample: Dict[str, Any]) -> str:
+        """Key identifying samples that would send the model an identical prompt."""
+        return hashlib.sha1(f"{sample['intent']}|{sample['customer_query']}".encode()).hexdigest()
+    
+    async def generate_responses_with_batch_api(self, samples: List[Dict[str, Any]], work_dir: Path) -> Dict[str, Dict[str, Any]]:
+        """Generate ideal responses through the OpenAI Batch API.
+        
+        Batch jobs are billed at half the real-time price and draw on a separate
+        rate-limit pool, at the cost of up to 24h turnaround. Returns responses
+        keyed by conversation_id; samples whose request failed are omitted.
+        """
+        requests_path = work_dir / "ideal_response_batch_requests.jsonl"
+        with open(requests_path, 'wb') as f:
+            for i, sample in enumerate(samples):
+                request = {
+                    "custom_id": sample["conversation_id"],
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": self.build_completion_request(
+                        sample["customer_query"], sample["intent"], sample["entities"],
+                        temperature=self.annealed_temperature(i / len(samples))
+                    )
+                }
+                f.write(orjson.dumps(request) + b"\n")
+        
+        with open(requests_path, 'rb') as f:
+            batch_file = await self.client.files.create(file=f, purpose="batch")
+        
+        batch = await self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        print(f"Submitted batch {batch.id} with {len(samples)} requests")
+        
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+            batch = await self.client.batches.retrieve(batch.id)
+            print(f"  Batch {batch.id}: {batch.status} "
+                  f"({batch.request_counts.completed}/{batch.request_counts.total} done)")
+        
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+        
+        output = await self.client.files.content(batch.output_file_id)
+        
+        responses = {}
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            result = orjson.loads(line)
+            response = result.get("response") or {}
+            if response.get("status_code") != 200:
+                print(f"  Request {result['custom_id']} failed: {result.get('error')}")
+                continue
+            responses[result["custom_id"]] = self.parse_ideal_response(
+                response["body"]["choices"][0]["message"]["content"]
+            )
+        
+        return responses
+    
+    async def generate_dataset(
+        self,
+        num_samples: int = 500,
+        output_file: str = "../data/processed/grammarly_support_dataset.csv",
+        use_batch_api: bool = False
+    ):
+        """Generate the full dataset.
+        
+        With use_batch_api, all queries are generated locally up front and their
+        ideal responses are requested as a single OpenAI Batch API job.
+        """
         output_path = Path(output_file)
         output_path.parent.mkdir(parents=True, exist_ok=True)
+        self._batch_ts = datetime.utcnow().isoformat()
         
         # Split distribution
         train_ratio = 0.7
@@ -275,8 +588,6 @@ Generate the ideal support response:"""
         val_size = int(num_samples * val_ratio)
         test_size = num_samples - train_size - val_size
         
-        dataset = []
-        
         # Generate samples
         print(f"Generating {num_samples} dataset entries...")
         
@@ -287,43 +598,21 @@ Generate the ideal support response:"""
             ("test", test_size)
         ]
         
-        for split, size in sample_configs:
-            print(f"Generating {size} {split} samples...")
-            tasks = []
-            
-            for i in range(size):
-                conversation_id = f"{split}_{i:05d}"
-                tasks.append(self.generate_dataset_entry(conversation_id, split))
-                
-                # Process in batches
-                if len(tasks) >= 10:
-                    results = await asyncio.gather(*tasks)
-                    dataset.extend(results)
-                    tasks = []
-                    await asyncio.sleep(1)  # Rate limiting
-            
-            # Process remaining tasks
-            if tasks:
-                results = await asyncio.gather(*tasks)
-                dataset.extend(results)
+        samples = [
+            self.create_sample(f"{split}_{i:05d}", split)
+            for split, size in sample_configs
+            for i in range(size)
+        ]
         
-        # Save to CSV
         fieldnames = [
             "conversation_id", "split", "customer_query", "intent", 
             "confidence", "entities", "urgency", "ideal_response", 
             "resolution_potential", "timestamp"
         ]
         
-        with open(output_path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(dataset)
-        
-        print(f"Dataset saved to {output_path}")
-        
-        # Save statistics
+        # Statistics are tallied as rows are written, so entries can be dropped right away
         stats = {
-            "total_samples": len(dataset),
+            "total_samples": 0,
             "splits": {
                 "train": train_size,
                 "validation": val_size,
@@ -331,21 +620,81 @@ Generate the ideal support response:"""
             },
             "intents": {},
             "urgency_distribution": {},
-            "resolution_rate": sum(1 for d in dataset if d["resolution_potential"]) / len(dataset)
+            "resolution_rate": 0.0
         }
+        intent_counts = Counter()
+        urgency_counts = Counter()
+        resolved = 0
+        
+        # Stream rows to disk as they are produced rather than holding the whole dataset
+        with open(output_path, 'w', newline='', encoding='utf-8', buffering=1 << 20) as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            
+            def write_entries(entries: List[Dict[str, Any]]):
+                nonlocal resolved
+                for entry in entries:
+                    writer.writerow(entry)
+                    intent_counts[entry["intent"]] += 1
+                    urgency_counts[entry["urgency"]] += 1
+                    resolved += entry["resolution_potential"]
+                    stats["total_samples"] += 1
+            
+            # Templates make duplicate (intent, query) pairs common; each is sent to the model once
+            samples_by_key: Dict[str, List[Dict[str, Any]]] = {}
+            for sample in samples:
+                samples_by_key.setdefault(self.response_cache_key(sample), []).append(sample)
+            
+            def write_response(key: str, ideal: Dict[str, Any]):
+                self._response_cache[key] = ideal
+                write_entries(self.build_entry(sample, ideal) for sample in samples_by_key[key])
+            
+            pending = []
+            for key, key_samples in samples_by_key.items():
+                if key in self._response_cache:
+                    write_response(key, self._response_cache[key])
+                else:
+                    pending.append(key_samples[0])
+            print(f"{len(pending)} unique queries need ideal responses")
+            
+            # Nothing to request when every query was answered from the response cache;
+            # an empty batch upload would be rejected by the API
+            if pending:
+                if use_batch_api:
+                    responses = await self.generate_responses_with_batch_api(pending, output_path.parent)
+                    for sample in pending:
+                        if sample["conversation_id"] in responses:
+                            write_response(self.response_cache_key(sample), responses[sample["conversation_id"]])
+                else:
+                    groups = [
+                        pending[i:i + RESPONSES_PER_REQUEST]
+                        for i in range(0, len(pending), RESPONSES_PER_REQUEST)
+                    ]
+                    print(f"Requesting ideal responses in {len(groups)} groups of up to {RESPONSES_PER_REQUEST}...")
+                    
+                    # Schedule every group at once; create_chat_completion enforces the limits
+                    tasks = [
+                        self.generate_group_responses(group, self.annealed_temperature(i / len(groups)))
+                        for i, group in enumerate(groups)
+                    ]
+                    for next_group in asyncio.as_completed(tasks):
+                        for sample, ideal in await next_group:
+                            write_response(self.response_cache_key(sample), ideal)
         
-        for entry in dataset:
-            intent = entry["intent"]
-            urgency = entry["urgency"]
-            stats["intents"][intent] = stats["intents"].get(intent, 0) + 1
-            stats["urgency_distribution"][urgency] = stats["urgency_distribution"].get(urgency, 0) + 1
+        print(f"Dataset saved to {output_path}")
+        
+        # Save statistics
+        stats["intents"] = dict(intent_counts)
+        stats["urgency_distribution"] = dict(urgency_counts)
+        if stats["total_samples"]:
+            stats["resolution_rate"] = resolved / stats["total_samples"]
         
         stats_path = output_path.parent / "dataset_stats.json"
-        with open(stats_path, 'w', encoding='utf-8') as f:
-            json.dump(stats, f, indent=2)
+        with open(stats_path, 'wb') as f:
+            f.write(orjson.dumps(stats, option=orjson.OPT_INDENT_2))
         
         print(f"Statistics saved to {stats_path}")
-        return dataset
+        return stats
 
 
 async def main():
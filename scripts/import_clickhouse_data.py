@@ -2,11 +2,57 @@
 """Import ClickHouse data exported by export_clickhouse_data.py."""
 
 import os
-import json
+import re
+import ast
+import ijson
+import orjson
 import clickhouse_connect
-import csv
 import argparse
+import threading
+import pyarrow as pa
+from pyarrow import csv as pa_csv
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Bytes of CSV parsed per Arrow block (Arrow's default is 1 MiB)
+CSV_READ_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Rows per insert; large inserts mean fewer round-trips and fewer MergeTree parts to merge
+CSV_INSERT_ROWS = 100_000
+JSON_INSERT_ROWS = 50_000
+
+# Tables with complex types that may have a JSON export alongside the Native data
+COMPLEX_TABLES = frozenset({'DynamicInContextLearningExample', 'JsonInference', 'ChatInference'})
+
+# Column definitions in SHOW CREATE TABLE output, e.g. `tags` Map(String, String)
+COLUMN_PATTERN = re.compile(r'`(\w+)`\s+(\w+(?:\((?:[^()]|\((?:[^()]|\([^()]*\))*\))*\))?)')
+WRAPPER_TYPE_PATTERN = re.compile(r'^(?:Nullable|LowCardinality)\((.*)\)$')
+
+# Arrow types for the scalar ClickHouse types found in exported CSVs
+ARROW_TYPES = {
+    'String': pa.string(),
+    'Bool': pa.bool_(),
+    'UInt8': pa.uint8(),
+    'UInt16': pa.uint16(),
+    'UInt32': pa.uint32(),
+    'UInt64': pa.uint64(),
+    'Int8': pa.int8(),
+    'Int16': pa.int16(),
+    'Int32': pa.int32(),
+    'Int64': pa.int64(),
+    'Float32': pa.float32(),
+    'Float64': pa.float64(),
+}
+
+# Tables are independent, so their data is imported concurrently, one client per worker thread
+MAX_IMPORT_WORKERS = 8
+_thread_local = threading.local()
+_print_lock = threading.Lock()
+
+def log(message=""):
+    """Print a progress line without interleaving output from worker threads."""
+    with _print_lock:
+        print(message)
 
 def get_clickhouse_client(host, port, user, password, database):
     """Create ClickHouse client connection."""
@@ -18,6 +64,12 @@ def get_clickhouse_client(host, port, user, password, database):
         database=database
     )
 
+def get_thread_client(args):
+    """Return the ClickHouse client owned by the current worker thread."""
+    if not hasattr(_thread_local, 'client'):
+        _thread_local.client = get_clickhouse_client(args.host, args.port, args.user, args.password, args.database)
+    return _thread_local.client
+
 def create_database_if_not_exists(client, database):
     """Create database if it doesn't exist."""
     try:
@@ -45,93 +97,201 @@ def import_schema(client, schema_file):
         print(f"  ✗ Error creating table {table_name}: {e}")
         return False
 
-def import_csv_data(client, csv_file, table_name):
-    """Import data from CSV file."""
+def read_column_types(schema_file):
+    """Return {column: ClickHouse type} parsed from a CREATE TABLE file."""
+    with open(schema_file, 'r') as f:
+        schema_sql = f.read()
+    
+    column_types = {}
+    for name, type_name in COLUMN_PATTERN.findall(schema_sql):
+        column_types.setdefault(name, type_name)
+    return column_types
+
+def csv_column_plan(column_types):
+    """Build Arrow column types and the set of JSON-encoded array columns from the schema."""
+    arrow_types = {}
+    json_columns = set()
+    for name, type_name in column_types.items():
+        # Nullable(...) / LowCardinality(...) read the same as their inner type
+        while (wrapped := WRAPPER_TYPE_PATTERN.match(type_name)):
+            type_name = wrapped.group(1)
+        
+        if type_name.startswith('Array('):
+            arrow_types[name] = pa.string()
+            json_columns.add(name)
+        elif type_name in ARROW_TYPES:
+            arrow_types[name] = ARROW_TYPES[type_name]
+    
+    return arrow_types, json_columns
+
+def parse_array_value(value):
+    """Parse one exported array cell: a JSON list, or ClickHouse's own ['a','b'] array syntax."""
+    try:
+        return orjson.loads(value)
+    except orjson.JSONDecodeError:
+        # ClickHouse quotes strings with ' and uses backslash escapes that Python literals share
+        return ast.literal_eval(value)
+
+def decode_json_list_columns(table, json_columns):
+    """Parse the given array-encoded string columns into list columns, failing loudly on bad values."""
+    for i, field in enumerate(table.schema):
+        if field.name not in json_columns:
+            continue
+        
+        column = table.column(i)
+        if column.null_count == len(column):
+            continue
+        
+        decoded = []
+        for value in column.to_pylist():
+            try:
+                decoded.append(parse_array_value(value) if value is not None else None)
+            except (ValueError, SyntaxError) as e:
+                # Leaving the column as text would only fail later, inside insert_arrow
+                raise ValueError(f"Array column '{field.name}': unparseable value {value[:80]!r}") from e
+        table = table.set_column(i, field.name, pa.array(decoded))
+    
+    return table
+
+def import_csv_data(client, csv_file, table_name, column_types):
+    """Import data from CSV file, typing columns from the table schema."""
     if not os.path.exists(csv_file):
-        print(f"  ⚠ No data file found for {table_name}")
+        log(f"  ⚠ No data file found for {table_name}")
         return
     
     try:
-        # Get file size
+        # Get file size; rows are counted as they are imported rather than in a separate pass
         file_size_mb = os.path.getsize(csv_file) / (1024 * 1024)
         
-        # Count rows (excluding header)
-        with open(csv_file, 'r') as f:
-            row_count = sum(1 for line in f) - 1
+        log(f"  → Importing {file_size_mb:.2f} MB into {table_name}...")
         
-        if row_count <= 0:
-            print(f"  ⚠ No data in {table_name}")
+        arrow_types, json_columns = csv_column_plan(column_types)
+        
+        if not json_columns:
+            # Nothing to re-encode, so ClickHouse's own CSV parser ingests the file as-is
+            with open(csv_file, 'rb') as f:
+                client.raw_insert(table_name, insert_block=f, fmt='CSVWithNames')
+            log(f"  ✓ Imported CSV data into {table_name}")
             return
         
-        print(f"  → Importing {row_count:,} rows ({file_size_mb:.2f} MB) into {table_name}...")
+        # Array columns may have been written as JSON lists, which ClickHouse's CSV parser can't read;
+        # each cell is parsed as JSON or, failing that, as a ClickHouse array literal.
+        # Arrow's C++ reader parses and type-converts whole blocks, which are grouped into large inserts.
+        # Column types come from the schema, so nothing is inferred or probed per value.
+        convert_options = pa_csv.ConvertOptions(
+            column_types=arrow_types,
+            null_values=[''],
+            # ClickHouse writes Bool as true/false; Python-written exports used True/False
+            true_values=['true', 'True', '1'],
+            false_values=['false', 'False', '0'],
+            strings_can_be_null=True
+        )
+        imported = 0
+        pending = []
+        pending_rows = 0
         
-        # Read CSV and import in batches
-        batch_size = 10000
-        with open(csv_file, 'r') as f:
-            reader = csv.DictReader(f)
-            
-            batch = []
-            imported = 0
-            
-            for row in reader:
-                # Convert string representations back to proper types
-                for key, value in row.items():
-                    if value == '':
-                        row[key] = None
-                    elif value == 'True':
-                        row[key] = True
-                    elif value == 'False':
-                        row[key] = False
-                    elif value.startswith('[') and value.endswith(']'):
-                        # Try to parse as list
-                        try:
-                            row[key] = json.loads(value)
-                        except:
-                            pass
-                
-                batch.append(row)
-                
-                if len(batch) >= batch_size:
-                    client.insert(table_name, batch)
-                    imported += len(batch)
-                    print(f"    ... imported {imported:,} rows", end='\r')
-                    batch = []
-            
-            # Import remaining batch
-            if batch:
-                client.insert(table_name, batch)
-                imported += len(batch)
-            
-            print(f"  ✓ Imported {imported:,} rows into {table_name}      ")
+        def flush():
+            client.insert_arrow(table_name, decode_json_list_columns(pa.Table.from_batches(pending), json_columns))
+        
+        read_options = pa_csv.ReadOptions(block_size=CSV_READ_BLOCK_SIZE)
+        # CSVWithNames keeps raw newlines inside quoted String values
+        parse_options = pa_csv.ParseOptions(newlines_in_values=True)
+        
+        for batch in pa_csv.open_csv(csv_file, read_options=read_options, parse_options=parse_options,
+                                     convert_options=convert_options):
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= CSV_INSERT_ROWS:
+                flush()
+                imported += pending_rows
+                pending, pending_rows = [], 0
+        
+        if pending_rows:
+            flush()
+            imported += pending_rows
+        
+        if imported == 0:
+            log(f"  ⚠ No data in {table_name}")
+            return
+        
+        log(f"  ✓ Imported {imported:,} rows into {table_name}")
             
     except Exception as e:
-        print(f"  ✗ Error importing data for {table_name}: {e}")
+        log(f"  ✗ Error importing data for {table_name}: {e}")
+
+def import_native_data(client, native_file, table_name):
+    """Import data from a ClickHouse Native format file."""
+    file_size_mb = os.path.getsize(native_file) / (1024 * 1024)
+    
+    try:
+        log(f"  → Importing {file_size_mb:.2f} MB of Native data into {table_name}...")
+        
+        # Native blocks go straight to the server without any Python-side decoding
+        with open(native_file, 'rb') as f:
+            client.raw_insert(table_name, insert_block=f, fmt='Native')
+        
+        log(f"  ✓ Imported Native data into {table_name}")
+        
+    except Exception as e:
+        log(f"  ✗ Error importing data for {table_name}: {e}")
 
 def import_json_data(client, json_file, table_name):
-    """Import data from JSON file (for complex types)."""
+    """Import data from JSON or JSON Lines file (for complex types)."""
     if not os.path.exists(json_file):
         return
     
     try:
-        with open(json_file, 'r') as f:
-            data = json.load(f)
+        log(f"  → Importing JSON data into {table_name}...")
         
-        if not data:
-            return
+        imported = 0
+        batch = []
         
-        print(f"  → Importing {len(data):,} rows from JSON into {table_name}...")
+        # Rows are parsed incrementally, so memory stays bounded by the batch size
+        with open(json_file, 'rb') as f:
+            if json_file.endswith('.jsonl'):
+                rows = (orjson.loads(line) for line in f if line.strip())
+            else:
+                rows = ijson.items(f, 'item', use_float=True)
+            
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= JSON_INSERT_ROWS:
+                    client.insert(table_name, batch)
+                    imported += len(batch)
+                    batch = []
         
-        # Import in batches
-        batch_size = 1000
-        for i in range(0, len(data), batch_size):
-            batch = data[i:i+batch_size]
+        if batch:
             client.insert(table_name, batch)
-            print(f"    ... imported {min(i+batch_size, len(data)):,} rows", end='\r')
+            imported += len(batch)
         
-        print(f"  ✓ Imported {len(data):,} rows from JSON into {table_name}      ")
+        if imported == 0:
+            return
+        
+        log(f"  ✓ Imported {imported:,} rows from JSON into {table_name}")
         
     except Exception as e:
-        print(f"  ⚠ Could not import JSON data for {table_name}: {e}")
+        log(f"  ⚠ Could not import JSON data for {table_name}: {e}")
+
+def import_table_data(schema_file, args):
+    """Import one table's data on the current worker thread."""
+    client = get_thread_client(args)
+    table_name = schema_file.replace('_schema.sql', '')
+    native_file = os.path.join(args.export_dir, f"{table_name}_data.native")
+    csv_file = os.path.join(args.export_dir, f"{table_name}_data.csv")
+    json_file = os.path.join(args.export_dir, f"{table_name}_data.jsonl")
+    if not os.path.exists(json_file):
+        # Older exports wrote a single JSON array
+        json_file = os.path.join(args.export_dir, f"{table_name}_data.json")
+    
+    # Check if we should use JSON import
+    if args.use_json and table_name in COMPLEX_TABLES and os.path.exists(json_file):
+        import_json_data(client, json_file, table_name)
+    elif os.path.exists(native_file):
+        import_native_data(client, native_file, table_name)
+    else:
+        # Older exports only contain CSV data
+        column_types = read_column_types(os.path.join(args.export_dir, schema_file))
+        import_csv_data(client, csv_file, table_name, column_types)
 
 def verify_import(client, table_name):
     """Verify imported data."""
@@ -193,18 +353,14 @@ def main():
         print()
         print("Importing data...")
         
-        # Import data
-        for schema_file in schema_files:
-            table_name = schema_file.replace('_schema.sql', '')
-            csv_file = os.path.join(args.export_dir, f"{table_name}_data.csv")
-            json_file = os.path.join(args.export_dir, f"{table_name}_data.json")
-            
-            # Check if we should use JSON import
-            complex_tables = ['DynamicInContextLearningExample', 'JsonInference', 'ChatInference']
-            if args.use_json and table_name in complex_tables and os.path.exists(json_file):
-                import_json_data(client, json_file, table_name)
-            else:
-                import_csv_data(client, csv_file, table_name)
+        # Import data on a worker pool; verification below stays on the main client
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_IMPORT_WORKERS, len(schema_files)))) as executor:
+            futures = {executor.submit(import_table_data, schema_file, args): schema_file for schema_file in schema_files}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    log(f"  ✗ Error importing {futures[future]}: {e}")
         
         print()
         print("Verifying import...")
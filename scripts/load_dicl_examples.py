@@ -1,62 +1,153 @@
 #!/usr/bin/env python3
 """Load DICL examples from scraped Grammarly articles into ClickHouse for TensorZero."""
 
-import json
+import mmap
+import re
 import uuid
-from typing import List, Dict, Any, Optional
+from pathlib import Path
+from functools import lru_cache
+import orjson
+import numpy as np
+from typing import List, Dict, Any, Iterator, Optional
 import clickhouse_connect
+from clickhouse_connect.driver.httputil import get_pool_manager
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from tqdm import tqdm
 import os
+import argparse
 from dotenv import load_dotenv
 
 load_dotenv()
 
+DICL_TABLE = 'DynamicInContextLearningExample'
+DICL_STAGING_TABLE = f'{DICL_TABLE}_staging'
+DICL_COLUMNS = ['id', 'function_name', 'variant_name', 'namespace', 'input', 'output', 'embedding']
+
+# Examples per insert; preparation streams chunks of this size instead of holding every example in memory
+INSERT_CHUNK_ROWS = 50_000
+
+# Let the server coalesce inserts into fewer parts; waiting keeps the rows visible before verification and table swaps
+INSERT_SETTINGS = {
+    'async_insert': 1,
+    'wait_for_async_insert': 1,
+    'async_insert_max_data_size': 10 * 1024 * 1024
+}
+
+# Knowledge base file locations; paths are written for the /app container layout
+DICL_CONFIG_PATH = Path("config/dicl_config.json")
+CONTAINER_ROOT = Path("/app")
+
+
+def knowledge_base_paths() -> Dict[str, Path]:
+    """Knowledge base paths from the DICL config, resolved against the working directory outside the container."""
+    section = orjson.loads(DICL_CONFIG_PATH.read_bytes())['knowledge_base']
+    paths = {}
+    for name, value in section.items():
+        path = Path(value)
+        if not path.exists() and path.is_relative_to(CONTAINER_ROOT):
+            path = path.relative_to(CONTAINER_ROOT)
+        paths[name] = path
+    return paths
+
+
+def convert_legacy_knowledge_base(legacy_path: Path, vectors_path: Path, meta_path: Path):
+    """Split a legacy single-JSON knowledge base into the vector array and metadata lines, once."""
+    kb_data = orjson.loads(legacy_path.read_bytes())
+    
+    # Written aside and renamed so an interrupted conversion is simply redone on the next load
+    vectors_tmp = vectors_path.with_name(vectors_path.name + '.tmp')
+    with open(vectors_tmp, 'wb') as f:
+        np.savez_compressed(f, embeddings=np.asarray([item['embedding'] for item in kb_data], dtype=np.float16))
+    
+    meta_tmp = meta_path.with_name(meta_path.name + '.tmp')
+    with open(meta_tmp, 'wb') as f:
+        for item in kb_data:
+            f.write(orjson.dumps({'text': item['text'], 'metadata': item.get('metadata', {})}) + b"\n")
+    
+    os.replace(meta_tmp, meta_path)
+    os.replace(vectors_tmp, vectors_path)
+
+# Map article categories to intents
+INTENT_MAPPING = {
+    'account': 'account_management',
+    'billing': 'billing_inquiry',
+    'technical': 'technical_support',
+    'feature': 'feature_request',
+    'integration': 'technical_support',
+    'grammar': 'general_inquiry',
+    'writing': 'general_inquiry',
+    'business': 'account_management',
+    'education': 'general_inquiry',
+    'security': 'account_management'
+}
+
+@lru_cache(maxsize=None)
+def intent_for_category(category: str) -> str:
+    """Map a lowercased article category to an intent; there are few categories, so each is resolved once."""
+    intent = INTENT_MAPPING.get(category)
+    if intent is not None:
+        return intent
+    
+    # Fall back to the first key contained in the category, in mapping order
+    for key, value in INTENT_MAPPING.items():
+        if key in category:
+            return value
+    return 'general_inquiry'
+
+# Articles mentioning any of these are treated as high urgency; one case-insensitive scan, no lowercased copy
+URGENT_KEYWORDS = ['not working', 'error', 'failed', 'broken', 'urgent', 'immediately']
+URGENT_PATTERN = re.compile('|'.join(map(re.escape, URGENT_KEYWORDS)), re.IGNORECASE)
+
+# Only the start of an article is scanned for urgent keywords, bounding the work on long articles
+URGENCY_SCAN_CHARS = 4096
+
 class DICLExampleLoader:
     def __init__(self):
+        # No session, so independent queries can run concurrently over the pooled connections
         self.client = clickhouse_connect.get_client(
             host='localhost',
             port=8123,
             username='chuser',
             password='chpassword',
-            database='tensorzero'
+            database='tensorzero',
+            autogenerate_session_id=False,
+            pool_mgr=get_pool_manager(maxsize=4)
         )
         self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         
     def load_knowledge_base_embeddings(self) -> List[Dict[str, Any]]:
         """Load the complete knowledge base with embeddings."""
         print("Loading knowledge base embeddings...")
-        with open("data/processed/knowledge_base_embeddings.json", "r") as f:
-            return json.load(f)
-    
-    def classify_intent_from_article(self, article_text: str, metadata: Dict) -> Dict[str, Any]:
-        """Generate an intent classification output based on article content."""
-        # Map article categories to intents
-        category = metadata.get('category', '').lower()
+        paths = knowledge_base_paths()
+        vectors_path, meta_path = paths['embeddings_path'], paths['metadata_path']
         
-        intent_mapping = {
-            'account': 'account_management',
-            'billing': 'billing_inquiry',
-            'technical': 'technical_support',
-            'feature': 'feature_request',
-            'integration': 'technical_support',
-            'grammar': 'general_inquiry',
-            'writing': 'general_inquiry',
-            'business': 'account_management',
-            'education': 'general_inquiry',
-            'security': 'account_management'
-        }
+        # Checkouts ship the legacy single-JSON knowledge base; convert it instead of re-embedding
+        if not (vectors_path.exists() and meta_path.exists()) and paths['legacy_embeddings_path'].exists():
+            print(f"Converting {paths['legacy_embeddings_path']} to {vectors_path.name} and {meta_path.name}...")
+            convert_legacy_knowledge_base(paths['legacy_embeddings_path'], vectors_path, meta_path)
+        
+        # Vectors are stored as float16; keep them as packed float32 rows (the column is Array(Float32))
+        with np.load(vectors_path) as vectors:
+            embeddings = vectors['embeddings'].astype(np.float32)
         
-        # Find the best matching intent
-        intent = 'general_inquiry'
-        for key, value in intent_mapping.items():
-            if key in category:
-                intent = value
-                break
+        # One JSON line per chunk, aligned with the rows of the vector array; the file is memory-mapped
+        # and lines are sliced straight from the mapping, so bytes go to orjson without buffered reads
+        with open(meta_path, "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            kb_data = [orjson.loads(line) for line in iter(mm.readline, b"")]
+        
+        for item, embedding in zip(kb_data, embeddings):
+            item['embedding'] = embedding
+        
+        return kb_data
+    
+    def classify_intent_from_article(self, article_text: str, category: str) -> Dict[str, Any]:
+        """Generate an intent classification output based on article content and its lowercased category."""
+        intent = intent_for_category(category)
         
         # Determine urgency based on keywords
-        urgent_keywords = ['not working', 'error', 'failed', 'broken', 'urgent', 'immediately']
-        urgency = 'high' if any(kw in article_text.lower() for kw in urgent_keywords) else 'medium'
+        urgency = 'high' if URGENT_PATTERN.search(article_text, 0, URGENCY_SCAN_CHARS) else 'medium'
         
         return {
             "intent": intent,
@@ -70,15 +161,21 @@ class DICLExampleLoader:
             }
         }
     
-    def prepare_dicl_examples(self) -> List[Dict[str, Any]]:
-        """Prepare DICL examples from knowledge base for ClickHouse."""
+    def prepare_dicl_examples(self) -> Iterator[Dict[str, List[Any]]]:
+        """Prepare DICL examples from knowledge base for ClickHouse.
+        
+        Yields chunks of up to INSERT_CHUNK_ROWS examples, as one list per column.
+        """
         # Load knowledge base with embeddings
         kb_data = self.load_knowledge_base_embeddings()
         
-        prepared_examples = []
+        columns = {name: [] for name in DICL_COLUMNS}
         print(f"Processing {len(kb_data)} knowledge base articles...")
         
-        for item in tqdm(kb_data):  # Process all articles
+        # Random bits for both example ids of every article, drawn in one call
+        id_bytes = os.urandom(32 * len(kb_data))
+        
+        for i, item in enumerate(tqdm(kb_data)):  # Process all articles
             text = item['text']
             embedding = item['embedding']
             metadata = item.get('metadata', {})
@@ -89,124 +186,127 @@ class DICLExampleLoader:
             
             # Generate a question-like input from the article
             # Take the first sentence or title as the "question"
-            lines = text.split('\n')
-            title = metadata.get('title', lines[0] if lines else text[:100])
+            title = metadata.get('title')
+            if title is None:
+                # Only the first line is needed, so stop at the first newline instead of splitting the whole text
+                title = text.partition('\n')[0]
+            
+            # Both examples share the namespace and the same float32 embedding array, never copies
+            namespace = metadata.get('category', 'general')
             
             # Create example for classify_intent
-            intent_output = self.classify_intent_from_article(text, metadata)
+            intent_output = self.classify_intent_from_article(text, namespace.lower())
             
-            intent_example = {
-                'id': str(uuid.uuid4()),  # TensorZero will handle UUID conversion
-                'function_name': 'classify_intent',
-                'variant_name': 'gpt_4o_mini_dicl',
-                'namespace': metadata.get('category', 'general'),
-                'input': json.dumps({
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [{"type": "text", "value": title}]
-                        }
-                    ]
-                }),
-                'output': json.dumps(intent_output),
-                'embedding': embedding
-            }
-            prepared_examples.append(intent_example)
+            columns['id'].append(uuid.UUID(bytes=id_bytes[32 * i:32 * i + 16], version=4))
+            columns['function_name'].append('classify_intent')
+            columns['variant_name'].append('gpt_4o_mini_dicl')
+            columns['namespace'].append(namespace)
+            columns['input'].append(orjson.dumps({
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": [{"type": "text", "value": title}]
+                    }
+                ]
+            }).decode())
+            columns['output'].append(orjson.dumps(intent_output).decode())
+            columns['embedding'].append(embedding)
             
             # Create example for generate_response
             # The output is the actual article content (the answer)
-            response_example = {
-                'id': str(uuid.uuid4()),
-                'function_name': 'generate_response',
-                'variant_name': 'gpt_4o_mini_dicl',
-                'namespace': metadata.get('category', 'general'),
-                'input': json.dumps({
-                    "query": title,
-                    "intent": intent_output['intent'],
-                    "urgency": intent_output['urgency'],
-                    "entities": intent_output['entities'],
-                    "conversation_history": []
-                }),
-                'output': text[:1000],  # Limit response length
-                'embedding': embedding
-            }
-            prepared_examples.append(response_example)
+            columns['id'].append(uuid.UUID(bytes=id_bytes[32 * i + 16:32 * i + 32], version=4))
+            columns['function_name'].append('generate_response')
+            columns['variant_name'].append('gpt_4o_mini_dicl')
+            columns['namespace'].append(namespace)
+            columns['input'].append(orjson.dumps({
+                "query": title,
+                "intent": intent_output['intent'],
+                "urgency": intent_output['urgency'],
+                "entities": intent_output['entities'],
+                "conversation_history": []
+            }).decode())
+            columns['output'].append(text[:1000])  # Limit response length
+            columns['embedding'].append(embedding)
+            
+            if len(columns['id']) >= INSERT_CHUNK_ROWS:
+                yield columns
+                columns = {name: [] for name in DICL_COLUMNS}
         
-        return prepared_examples
+        if columns['id']:
+            yield columns
     
-    def insert_examples(self, examples: List[Dict[str, Any]]):
-        """Insert examples into ClickHouse."""
-        if not examples:
-            print("No examples to insert")
-            return
-        
-        print(f"Inserting {len(examples)} examples into ClickHouse...")
+    def insert_examples(self, chunks: Iterator[Dict[str, List[Any]]], table: str = DICL_TABLE) -> int:
+        """Insert examples into ClickHouse as they are prepared; returns how many were inserted."""
+        print("Inserting examples into ClickHouse...")
         
-        # Prepare data for insertion
-        data = []
-        for ex in examples:
-            data.append([
-                ex['id'],
-                ex['function_name'],
-                ex['variant_name'],
-                ex['namespace'],
-                ex['input'],
-                ex['output'],
-                ex['embedding']
-            ])
-        
-        # Insert into ClickHouse in batches
-        batch_size = 100
-        for i in range(0, len(data), batch_size):
-            batch = data[i:i+batch_size]
+        num_examples = 0
+        for columns in chunks:
+            # Each chunk is one insert; the column lists go in as-is, with no row transposition
             self.client.insert(
-                'DynamicInContextLearningExample',
-                batch,
-                column_names=['id', 'function_name', 'variant_name', 'namespace', 'input', 'output', 'embedding']
+                table,
+                [columns[name] for name in DICL_COLUMNS],
+                column_names=DICL_COLUMNS,
+                column_oriented=True,
+                settings=INSERT_SETTINGS
             )
-            print(f"  Inserted batch {i//batch_size + 1}/{(len(data)-1)//batch_size + 1}")
+            num_examples += len(columns['id'])
+        
+        if not num_examples:
+            print("No examples to insert")
+            return 0
         
-        print(f"✅ Successfully inserted {len(examples)} examples!")
+        print(f"✅ Successfully inserted {num_examples} examples!")
+        return num_examples
+    
+    def replace_examples(self, chunks: Iterator[Dict[str, List[Any]]]):
+        """Replace all existing examples without a window where the table is empty."""
+        # Load into a staging copy, then swap it in atomically
+        self.client.command(f"DROP TABLE IF EXISTS {DICL_STAGING_TABLE}")
+        self.client.command(f"CREATE TABLE {DICL_STAGING_TABLE} AS {DICL_TABLE}")
+        try:
+            # An empty load (e.g. a failed prepare step) must never be swapped over the live examples
+            if not self.insert_examples(chunks, table=DICL_STAGING_TABLE):
+                print("⚠️  Nothing loaded; keeping existing examples.")
+                return
+            self.client.command(f"EXCHANGE TABLES {DICL_STAGING_TABLE} AND {DICL_TABLE}")
+            print("🔁 Replaced existing examples.")
+        finally:
+            self.client.command(f"DROP TABLE IF EXISTS {DICL_STAGING_TABLE}")
     
     def verify_insertion(self):
         """Verify examples were inserted and show statistics."""
-        # Total count
-        result = self.client.query("SELECT COUNT(*) FROM DynamicInContextLearningExample")
-        total_count = result.result_rows[0][0]
-        print(f"\n📊 Total examples in ClickHouse: {total_count}")
-        
-        # Count by function
-        function_counts = self.client.query("""
-            SELECT function_name, COUNT(*) as count
+        queries = [
+            # Total count and counts by function and namespace, tallied in one scan
+            """
+            SELECT COUNT(*) as total,
+                   sumMap(map(function_name, toUInt64(1))) as by_function,
+                   sumMap(map(namespace, toUInt64(1))) as by_namespace
             FROM DynamicInContextLearningExample
-            GROUP BY function_name
-        """)
-        
-        print("\n📈 Examples by function:")
-        for row in function_counts.result_rows:
-            print(f"  - {row[0]}: {row[1]} examples")
-        
-        # Count by namespace
-        namespace_counts = self.client.query("""
-            SELECT namespace, COUNT(*) as count
-            FROM DynamicInContextLearningExample
-            GROUP BY namespace
-            ORDER BY count DESC
-            LIMIT 5
-        """)
-        
-        print("\n📁 Top 5 namespaces:")
-        for row in namespace_counts.result_rows:
-            print(f"  - {row[0]}: {row[1]} examples")
-        
-        # Show sample examples
-        samples = self.client.query("""
+            """,
+            # Sample examples
+            """
             SELECT function_name, namespace, 
                    substring(input, 1, 100) as input_sample,
                    substring(output, 1, 100) as output_sample
             FROM DynamicInContextLearningExample 
             LIMIT 3
-        """)
+            """
+        ]
+        
+        # The queries are independent, so they run concurrently rather than one round-trip after another
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            counts, samples = executor.map(self.client.query, queries)
+        
+        total_count, function_counts, namespace_counts = counts.result_rows[0]
+        print(f"\n📊 Total examples in ClickHouse: {total_count}")
+        
+        print("\n📈 Examples by function:")
+        for function_name, count in function_counts.items():
+            print(f"  - {function_name}: {count} examples")
+        
+        print("\n📁 Top 5 namespaces:")
+        for namespace, count in sorted(namespace_counts.items(), key=lambda x: x[1], reverse=True)[:5]:
+            print(f"  - {namespace}: {count} examples")
         
         print("\n📝 Sample examples:")
         for i, row in enumerate(samples.result_rows, 1):
@@ -216,35 +316,41 @@ class DICLExampleLoader:
             print(f"  Input: {row[2][:80]}...")
             print(f"  Output: {row[3][:80]}...")
     
-    def test_similarity_search(self, query: str = "How do I reset my password?"):
+    def test_similarity_search(self, queries: Optional[List[str]] = None):
         """Test that similarity search works with the loaded examples."""
-        print(f"\n🔍 Testing similarity search for: '{query}'")
+        queries = queries or ["How do I reset my password?"]
         
-        # Generate embedding for the query
-        embedding = self.openai_client.embeddings.create(
+        # Embed every query with a single request
+        embeddings = self.openai_client.embeddings.create(
             model="text-embedding-3-small",
-            input=query
-        ).data[0].embedding
-        
-        # Search for similar examples
-        result = self.client.query(f"""
-            SELECT 
-                namespace,
-                substring(output, 1, 200) as output_sample,
-                cosineDistance(embedding, {embedding}) as distance
-            FROM DynamicInContextLearningExample
-            WHERE function_name = 'generate_response'
-            ORDER BY distance ASC
-            LIMIT 3
-        """)
+            input=queries
+        ).data
         
-        print("\nTop 3 most similar examples:")
-        for i, row in enumerate(result.result_rows, 1):
-            print(f"\n{i}. Namespace: {row[0]}, Distance: {row[2]:.4f}")
-            print(f"   Response: {row[1][:150]}...")
+        for query, item in zip(queries, embeddings):
+            print(f"\n🔍 Testing similarity search for: '{query}'")
+            
+            # Search for similar examples; the embedding is bound as a typed parameter, not spliced into the SQL
+            result = self.client.query("""
+                SELECT 
+                    namespace,
+                    substring(output, 1, 200) as output_sample,
+                    cosineDistance(embedding, {embedding:Array(Float32)}) as distance
+                FROM DynamicInContextLearningExample
+                WHERE function_name = 'generate_response'
+                ORDER BY distance ASC
+                LIMIT 3
+            """, parameters={'embedding': item.embedding})
+            
+            print("\nTop 3 most similar examples:")
+            for i, row in enumerate(result.result_rows, 1):
+                print(f"\n{i}. Namespace: {row[0]}, Distance: {row[2]:.4f}")
+                print(f"   Response: {row[1][:150]}...")
     
-    def run(self):
-        """Main execution function."""
+    def run(self, force: bool = False):
+        """Main execution function.
+        
+        With force (or DICL_FORCE_RELOAD set), existing examples are replaced without prompting.
+        """
         try:
             # Check if examples already exist
             result = self.client.query("SELECT COUNT(*) FROM DynamicInContextLearningExample")
@@ -252,19 +358,22 @@ class DICLExampleLoader:
             
             if existing_count > 0:
                 print(f"⚠️  Found {existing_count} existing examples in ClickHouse.")
-                response = input("Do you want to clear existing examples and reload? (y/n): ")
-                if response.lower() == 'y':
-                    self.client.query("TRUNCATE TABLE DynamicInContextLearningExample")
-                    print("🗑️  Cleared existing examples.")
-                else:
+                reload = force or bool(os.getenv("DICL_FORCE_RELOAD"))
+                if not reload:
+                    response = input("Do you want to clear existing examples and reload? (y/n): ")
+                    reload = response.lower() == 'y'
+                if not reload:
                     print("Keeping existing examples.")
                     self.verify_insertion()
                     self.test_similarity_search()
                     return
             
             # Prepare and insert examples
-            examples = self.prepare_dicl_examples()
-            self.insert_examples(examples)
+            chunks = self.prepare_dicl_examples()
+            if existing_count > 0:
+                self.replace_examples(chunks)
+            else:
+                self.insert_examples(chunks)
             
             # Verify insertion
             self.verify_insertion()
@@ -286,5 +395,9 @@ class DICLExampleLoader:
             raise
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load DICL examples into ClickHouse')
+    parser.add_argument('--force', action='store_true', help='Replace existing examples without prompting')
+    args = parser.parse_args()
+    
     loader = DICLExampleLoader()
-    loader.run()
\ No newline at end of file
+    loader.run(force=args.force)
\ No newline at end of file
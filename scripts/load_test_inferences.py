@@ -3,10 +3,12 @@
 import asyncio
 import random
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Set
 import json
 import sys
 import os
+import numpy as np
+from tqdm.asyncio import tqdm
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -15,6 +17,12 @@ from utils.tensorzero_client import TensorZeroClient
 from src.validation import SupportRequestInput
 
 
+# Inferences in flight at once; bounds the load on the gateway instead of a fixed delay
+MAX_CONCURRENT_INFERENCES = 10
+
+# Feedback sends allowed in flight before new ones wait for a free slot
+MAX_PENDING_FEEDBACK = 200
+
 # Realistic test queries organized by category
 TEST_QUERIES = {
     "integration_help": [
@@ -111,17 +119,37 @@ CONVERSATION_HISTORIES = [
 ]
 
 
+async def queue_feedback(coro, pending: Set[asyncio.Task], slots: asyncio.Semaphore):
+    """Send feedback in the background, waiting for a slot once too many sends are in flight."""
+    await slots.acquire()
+    task = asyncio.create_task(coro)
+    pending.add(task)
+    
+    def on_done(done: asyncio.Task):
+        pending.discard(done)
+        slots.release()
+        # Feedback is best-effort; retrieve the exception so it isn't reported as unhandled
+        if not done.cancelled():
+            done.exception()
+    
+    task.add_done_callback(on_done)
+
+
 async def generate_test_inference(
     client: TensorZeroClient,
     query: str,
     intent_category: str,
     user_context: Dict[str, str],
     conversation_history: List[Dict[str, str]],
-    inference_num: int
+    inference_num: int,
+    pending_feedback: Set[asyncio.Task],
+    feedback_slots: asyncio.Semaphore,
+    verbose: bool = False
 ) -> Dict[str, Any]:
     """Generate a single test inference with feedback."""
     
-    print(f"\n[{inference_num}/100] Processing: {query[:50]}...")
+    if verbose:
+        print(f"\n[{inference_num}/100] Processing: {query[:50]}...")
     
     # Step 1: Classify intent
     conversation_id = f"test-conv-{inference_num:03d}"
@@ -134,7 +162,8 @@ async def generate_test_inference(
         )
         
         episode_id = classification['raw_response'].get('episode_id')
-        print(f"  ✓ Intent: {classification['intent']} (confidence: {classification['confidence']:.2f})")
+        if verbose:
+            print(f"  ✓ Intent: {classification['intent']} (confidence: {classification['confidence']:.2f})")
         
         # Step 2: Generate response
         response = await client.generate_response(
@@ -144,8 +173,9 @@ async def generate_test_inference(
             conversation_history=conversation_history
         )
         
-        response_preview = response['content'][:100] + "..." if len(response['content']) > 100 else response['content']
-        print(f"  ✓ Response generated: {response_preview}")
+        if verbose:
+            response_preview = response['content'][:100] + "..." if len(response['content']) > 100 else response['content']
+            print(f"  ✓ Response generated: {response_preview}")
         
         # Step 3: Simulate quality metrics and feedback
         # Intent accuracy - higher confidence means more likely to be accurate
@@ -222,12 +252,11 @@ async def generate_test_inference(
             )
         )
         
-        # Execute feedback (ignore errors)
-        try:
-            await asyncio.gather(*feedback_tasks, return_exceptions=True)
-            print(f"  ✓ Feedback sent - Quality: {response_quality:.2f}, Satisfaction: {customer_satisfaction:.2f}")
-        except Exception as e:
-            print(f"  ⚠ Feedback error (continuing): {str(e)[:50]}")
+        # Send feedback off the critical path (errors are ignored); it is drained before exit
+        for feedback in feedback_tasks:
+            await queue_feedback(feedback, pending_feedback, feedback_slots)
+        if verbose:
+            print(f"  ✓ Feedback queued - Quality: {response_quality:.2f}, Satisfaction: {customer_satisfaction:.2f}")
         
         return {
             "success": True,
@@ -240,7 +269,8 @@ async def generate_test_inference(
         }
         
     except Exception as e:
-        print(f"  ✗ Error: {str(e)[:100]}")
+        if verbose:
+            print(f"  ✗ Error: {str(e)[:100]}")
         return {
             "success": False,
             "inference_num": inference_num,
@@ -249,8 +279,11 @@ async def generate_test_inference(
         }
 
 
-async def load_test_inferences():
-    """Load 100 test inferences into ClickHouse."""
+async def load_test_inferences(verbose: bool = False):
+    """Load 100 test inferences into ClickHouse.
+    
+    Progress is shown as a single bar; verbose also prints each inference's steps.
+    """
     
     print("Loading 100 test inferences with realistic data...")
     print("=" * 60)
@@ -259,45 +292,62 @@ async def load_test_inferences():
     test_cases = []
     queries_per_category = 20  # 5 categories × 20 = 100 inferences
     
+    rng = np.random.default_rng()
+    
     for category, queries in TEST_QUERIES.items():
+        # Draw every random choice for the category up front
+        query_idx = rng.integers(len(queries), size=queries_per_category)
+        context_idx = rng.integers(len(USER_CONTEXTS), size=queries_per_category)
+        history_idx = rng.integers(len(CONVERSATION_HISTORIES), size=queries_per_category)
+        lowercase = rng.random(queries_per_category) > 0.7  # Some users don't capitalize
+        strip_punctuation = rng.random(queries_per_category) > 0.8  # Some users don't use punctuation
+        
         for i in range(queries_per_category):
-            query = random.choice(queries)
-            user_context = random.choice(USER_CONTEXTS)
-            conversation_history = random.choice(CONVERSATION_HISTORIES)
+            query = queries[query_idx[i]]
             
             # Add some variation to queries
-            if random.random() > 0.7:
-                query = query.lower()  # Some users don't capitalize
-            if random.random() > 0.8:
-                query = query.rstrip('.,?!')  # Some users don't use punctuation
+            if lowercase[i]:
+                query = query.lower()
+            if strip_punctuation[i]:
+                query = query.rstrip('.,?!')
             
             test_cases.append({
                 "query": query,
                 "category": category,
-                "user_context": user_context,
-                "conversation_history": conversation_history
+                "user_context": USER_CONTEXTS[context_idx[i]],
+                "conversation_history": CONVERSATION_HISTORIES[history_idx[i]]
             })
     
     # Shuffle for more realistic distribution
-    random.shuffle(test_cases)
+    rng.shuffle(test_cases)
+    
+    # Process inferences concurrently, a bounded number at a time
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_INFERENCES)
+    pending_feedback: Set[asyncio.Task] = set()
+    feedback_slots = asyncio.Semaphore(MAX_PENDING_FEEDBACK)
     
-    # Process inferences
     async with TensorZeroClient() as client:
-        results = []
+        async def run_test_case(i: int, test_case: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await generate_test_inference(
+                    client=client,
+                    query=test_case["query"],
+                    intent_category=test_case["category"],
+                    user_context=test_case["user_context"],
+                    conversation_history=test_case["conversation_history"],
+                    inference_num=i,
+                    pending_feedback=pending_feedback,
+                    feedback_slots=feedback_slots,
+                    verbose=verbose
+                )
         
-        for i, test_case in enumerate(test_cases, 1):
-            result = await generate_test_inference(
-                client=client,
-                query=test_case["query"],
-                intent_category=test_case["category"],
-                user_context=test_case["user_context"],
-                conversation_history=test_case["conversation_history"],
-                inference_num=i
-            )
-            results.append(result)
-            
-            # Small delay to avoid overwhelming the system
-            await asyncio.sleep(0.5)
+        results = await tqdm.gather(
+            *(run_test_case(i, test_case) for i, test_case in enumerate(test_cases, 1)),
+            desc="Inferences"
+        )
+        
+        # Let outstanding feedback finish before the client closes
+        await asyncio.gather(*pending_feedback, return_exceptions=True)
     
     # Summary
     print("\n" + "=" * 60)
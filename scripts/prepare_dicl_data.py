@@ -2,32 +2,76 @@
 
 import json
 import csv
+import hashlib
 import os
+import random
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import asyncio
+import numpy as np
+import orjson
+import tiktoken
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 
 # Load environment variables from .env file
 load_dotenv()
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Embedding batches in flight at once; the work is bound by request latency, not CPU
+MAX_CONCURRENT_EMBEDDING_BATCHES = 5
+
+# Example query generations in flight at once
+MAX_CONCURRENT_EXAMPLE_REQUESTS = 8
+
+# Knowledge base chunks are overlapping token windows so no sentence is only ever seen cut in half;
+# cl100k_base is the tokenizer of the embedding model
+CHUNK_ENCODING = "cl100k_base"
+CHUNK_TOKENS = 500
+CHUNK_STRIDE_TOKENS = 375
+
+# A tail shorter than this is folded into the last window instead of getting a near-duplicate window of its own
+MIN_TAIL_TOKENS = CHUNK_STRIDE_TOKENS // 3
+
+
+def token_windows(n_tokens: int, window: int = CHUNK_TOKENS, stride: int = CHUNK_STRIDE_TOKENS) -> List[Tuple[int, int]]:
+    """(start, end) token offsets of the sliding windows covering n_tokens tokens; none for empty content."""
+    if n_tokens == 0:
+        return []
+    
+    starts = np.arange(0, max(n_tokens - window, 0) + 1, stride).tolist()
+    bounds = [(start, start + window) for start in starts]
+    
+    # Tokens past the last regular window either get a window ending on the final token
+    # or, when only a few remain, extend the last window so they are never dropped
+    tail = n_tokens - bounds[-1][1]
+    if tail >= MIN_TAIL_TOKENS:
+        bounds.append((n_tokens - window, n_tokens))
+    elif tail > 0:
+        bounds[-1] = (bounds[-1][0], n_tokens)
+    return bounds
+
 
 class DICLDataPreparer:
     """Prepare scraped articles and examples for DICL."""
     
-    def __init__(self, articles_dir: str = "data/scraped"):
+    def __init__(self, articles_dir: str = "data/scraped", cache_dir: str = "data/embedding_cache"):
         self.articles_dir = Path(articles_dir)
         self.client = AsyncOpenAI()
         
+        # Embeddings already fetched, one file per text, so re-runs only pay for changed chunks
+        self.cache_dir = Path(cache_dir)
+        
     def load_articles(self) -> List[Dict[str, Any]]:
         """Load all scraped articles."""
-        articles = []
-        for file_path in sorted(self.articles_dir.glob("article_*.json")):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                article = json.load(f)
-                articles.append(article)
-        return articles
+        paths = sorted(self.articles_dir.glob("article_*.json"))
+        
+        # Overlap file reads across threads; orjson parses the raw bytes directly
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            return list(executor.map(lambda path: orjson.loads(path.read_bytes()), paths))
     
     def create_article_chunks(self, articles: List[Dict[str, Any]], chunk_size: int = 500) -> List[Dict[str, Any]]:
         """Split articles into chunks for embedding."""
@@ -41,34 +85,43 @@ class DICLDataPreparer:
             # Split content into paragraphs
             paragraphs = content.split('\n\n')
             
-            # Group paragraphs into chunks
-            current_chunk = []
-            current_size = 0
+            # Word counts split on any whitespace; scraped text separates lines with '\n', so counting spaces undercounts
+            sizes = np.fromiter((len(para.split()) for para in paragraphs), dtype=np.int64, count=len(paragraphs))
+            cumulative = np.cumsum(sizes)
             
-            for para in paragraphs:
-                para_size = len(para.split())
-                
-                if current_size + para_size > chunk_size and current_chunk:
-                    # Save current chunk
-                    chunk_text = '\n\n'.join(current_chunk)
-                    chunks.append({
-                        'text': f"Title: {title}\nCategory: {category}\n\n{chunk_text}",
-                        'metadata': {
-                            'article_title': title,
-                            'category': category,
-                            'url': article['url'],
-                            'chunk_id': f"{article['url']}#{len(chunks)}"
-                        }
-                    })
-                    current_chunk = [para]
-                    current_size = para_size
-                else:
-                    current_chunk.append(para)
-                    current_size += para_size
+            # Greedy packing: each chunk takes the longest run of paragraphs that fits in chunk_size,
+            # found by binary search on the running total; an oversized paragraph forms its own chunk
+            start = 0
+            while start < len(paragraphs):
+                offset = cumulative[start - 1] if start else 0
+                end = max(int(np.searchsorted(cumulative, offset + chunk_size, side='right')), start + 1)
+                chunk_text = '\n\n'.join(paragraphs[start:end])
+                chunks.append({
+                    'text': f"Title: {title}\nCategory: {category}\n\n{chunk_text}",
+                    'metadata': {
+                        'article_title': title,
+                        'category': category,
+                        'url': article['url'],
+                        'chunk_id': f"{article['url']}#{len(chunks)}"
+                    }
+                })
+                start = end
+        
+        return chunks
+    
+    def create_token_window_chunks(self, articles: List[Dict[str, Any]], window: int = CHUNK_TOKENS,
+                                   stride: int = CHUNK_STRIDE_TOKENS) -> List[Dict[str, Any]]:
+        """Split articles into overlapping windows of `window` tokens, starting every `stride` tokens."""
+        encoding = tiktoken.get_encoding(CHUNK_ENCODING)
+        token_lists = encoding.encode_batch([article['content'] for article in articles], disallowed_special=())
+        chunks = []
+        
+        for article, tokens in zip(articles, token_lists):
+            title = article['title']
+            category = article.get('category', 'General')
             
-            # Don't forget the last chunk
-            if current_chunk:
-                chunk_text = '\n\n'.join(current_chunk)
+            for start, end in token_windows(len(tokens), window, stride):
+                chunk_text = encoding.decode(tokens[start:end])
                 chunks.append({
                     'text': f"Title: {title}\nCategory: {category}\n\n{chunk_text}",
                     'metadata': {
@@ -81,26 +134,82 @@ class DICLDataPreparer:
         
         return chunks
     
+    @retry(
+        wait=wait_random_exponential(min=1, max=60),
+        stop=stop_after_attempt(5),
+        retry=retry_if_exception_type((RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)),
+        reraise=True
+    )
+    async def request_embeddings(self, batch: List[str]) -> List[List[float]]:
+        """Embed one batch of texts, retrying transient errors."""
+        response = await self.client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=batch
+        )
+        return [item.embedding for item in response.data]
+    
+    @retry(
+        wait=wait_random_exponential(min=1, max=60),
+        stop=stop_after_attempt(5),
+        retry=retry_if_exception_type((RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)),
+        reraise=True
+    )
+    async def request_example_query(self, prompt: str) -> str:
+        """Generate one customer query, retrying transient errors."""
+        response = await self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.8,
+            max_tokens=100
+        )
+        return response.choices[0].message.content.strip()
+    
+    def embedding_cache_path(self, text: str) -> Path:
+        """Cache file for a text's embedding; the model is part of the key so switching models never hits stale vectors."""
+        key = hashlib.sha256(f"{EMBEDDING_MODEL}|{text}".encode()).hexdigest()
+        return self.cache_dir / key[:2] / f"{key}.f32"
+    
+    @staticmethod
+    def read_cached_embeddings(paths: List[Path]) -> List[Optional[np.ndarray]]:
+        """Cached float32 vectors for the given cache files, None where a file is missing."""
+        return [np.fromfile(path, dtype=np.float32) if path.exists() else None for path in paths]
+    
+    @staticmethod
+    def write_cached_embeddings(paths: List[Path], embeddings: List[List[float]]):
+        """Store vectors as raw float32; each is written aside and renamed so an interrupted run never leaves a truncated entry."""
+        for path, embedding in zip(paths, embeddings):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            np.asarray(embedding, dtype=np.float32).tofile(tmp_path)
+            os.replace(tmp_path, path)
+    
     async def create_embeddings(self, texts: List[str], batch_size: int = 100) -> List[List[float]]:
-        """Create embeddings for texts using OpenAI's text-embedding-3-small."""
-        embeddings = []
-        
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            response = await self.client.embeddings.create(
-                model="text-embedding-3-small",
-                input=batch
-            )
-            batch_embeddings = [item.embedding for item in response.data]
-            embeddings.extend(batch_embeddings)
+        """Create embeddings for texts using OpenAI's text-embedding-3-small, reusing cached ones."""
+        # Cache files are read and written on worker threads so file I/O never stalls the event loop
+        cache_paths = [self.embedding_cache_path(text) for text in texts]
+        embeddings = await asyncio.to_thread(self.read_cached_embeddings, cache_paths)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        print(f"{len(texts) - len(missing)} embeddings cached, {len(missing)} to request")
+        
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_EMBEDDING_BATCHES)
+        
+        async def embed_batch(indices: List[int]):
+            async with semaphore:
+                # Small jitter so released slots don't all fire at the same instant
+                await asyncio.sleep(random.uniform(0, 0.2))
+                batch_embeddings = await self.request_embeddings([texts[i] for i in indices])
             
-            if i + batch_size < len(texts):
-                await asyncio.sleep(0.5)  # Rate limiting
+            for i, embedding in zip(indices, batch_embeddings):
+                embeddings[i] = embedding
+            await asyncio.to_thread(self.write_cached_embeddings, [cache_paths[i] for i in indices], batch_embeddings)
         
+        await asyncio.gather(*(
+            embed_batch(missing[i:i + batch_size]) for i in range(0, len(missing), batch_size)
+        ))
         return embeddings
     
-    async def prepare_knowledge_base(self, output_dir: str = "data/processed"):
-        """Prepare knowledge base for DICL."""
+    async def prepare_knowledge_base(self, output_dir: str = "data/processed", chunking: str = "tokens"):
+        """Prepare knowledge base for DICL; chunking is "tokens" (sliding windows) or "paragraphs"."""
         output_path = Path(output_dir)
         output_path.mkdir(parents=True, exist_ok=True)
         
@@ -109,30 +218,13 @@ class DICLDataPreparer:
         print(f"Loaded {len(articles)} articles")
         
         print("Creating article chunks...")
-        chunks = self.create_article_chunks(articles)
+        if chunking == "paragraphs":
+            chunks = self.create_article_chunks(articles)
+        else:
+            chunks = self.create_token_window_chunks(articles)
         print(f"Created {len(chunks)} chunks")
         
-        print("Generating embeddings...")
-        texts = [chunk['text'] for chunk in chunks]
-        embeddings = await self.create_embeddings(texts)
-        
-        # Save chunks with embeddings
-        knowledge_base = []
-        for chunk, embedding in zip(chunks, embeddings):
-            knowledge_base.append({
-                'text': chunk['text'],
-                'embedding': embedding,
-                'metadata': chunk['metadata']
-            })
-        
-        # Save to file
-        kb_path = output_path / "knowledge_base_embeddings.json"
-        with open(kb_path, 'w', encoding='utf-8') as f:
-            json.dump(knowledge_base, f, indent=2)
-        
-        print(f"Knowledge base saved to {kb_path}")
-        
-        # Also save a CSV for easier inspection
+        # The CSV needs no embeddings, so it is written before the slow embedding step
         csv_path = output_path / "knowledge_base.csv"
         with open(csv_path, 'w', newline='', encoding='utf-8') as f:
             writer = csv.DictWriter(f, fieldnames=['chunk_id', 'title', 'category', 'text_preview'])
@@ -147,18 +239,34 @@ class DICLDataPreparer:
         
         print(f"Knowledge base CSV saved to {csv_path}")
         
-        return knowledge_base
+        print("Generating embeddings...")
+        texts = [chunk['text'] for chunk in chunks]
+        embeddings = await self.create_embeddings(texts)
+        
+        # Save vectors as one compact binary array and the rest as JSON Lines; row i of one is line i of the other
+        vectors_path = output_path / "knowledge_base_vectors.npz"
+        np.savez_compressed(vectors_path, embeddings=np.asarray(embeddings, dtype=np.float16))
+        
+        # Chunks already hold text and metadata, so each line is written straight from them
+        meta_path = output_path / "knowledge_base_meta.jsonl"
+        with open(meta_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(orjson.dumps({'text': chunk['text'], 'metadata': chunk['metadata']}) + b"\n")
+        
+        print(f"Knowledge base saved to {vectors_path} and {meta_path}")
     
     async def create_example_interactions(self, num_examples: int = 100):
         """Create example query-response pairs from articles for DICL."""
         articles = self.load_articles()
-        examples = []
-        
         
         print(f"Creating {num_examples} example interactions...")
         
-        for i in range(num_examples):
-            article = articles[i % len(articles)]
+        # A steady concurrency cap replaces the old pause every ten requests
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_EXAMPLE_REQUESTS)
+        completed = 0
+        
+        async def create_example(article: Dict[str, Any]) -> Dict[str, Any]:
+            nonlocal completed
             category = article.get('category', 'General')
             
             # Generate a query based on the article
@@ -170,26 +278,24 @@ Content Preview: {article['content'][:500]}...
 
 Generate a natural customer query (1-2 sentences) that someone might ask if they needed this information:"""
             
-            response = await self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.8,
-                max_tokens=100
-            )
+            async with semaphore:
+                query = await self.request_example_query(prompt)
             
-            query = response.choices[0].message.content.strip()
+            completed += 1
+            if completed % 10 == 0:
+                print(f"Created {completed} examples...")
             
-            # Create example
-            examples.append({
+            return {
                 'query': query,
                 'response': f"Based on the article '{article['title']}': {article['content'][:300]}...",
                 'article_url': article['url'],
                 'category': category
-            })
-            
-            if (i + 1) % 10 == 0:
-                print(f"Created {i + 1} examples...")
-                await asyncio.sleep(1)  # Rate limiting
+            }
+        
+        # gather keeps the examples in article order
+        examples = await asyncio.gather(*(
+            create_example(articles[i % len(articles)]) for i in range(num_examples)
+        ))
         
         # Save examples
         output_path = Path("data/processed")
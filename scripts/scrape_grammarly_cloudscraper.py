@@ -1,18 +1,153 @@
 """Script to scrape Grammarly help center using cloudscraper to bypass Cloudflare."""
 
-import json
+import multiprocessing
+import os
+import random
 import time
+import threading
+from collections import deque
+from statistics import median
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Dict, Any
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from typing import List, Dict, Any, Optional, Set
 import cloudscraper
-from bs4 import BeautifulSoup
+import orjson
+from bs4 import BeautifulSoup, SoupStrainer
+import soupsieve
+from selectolax.parser import HTMLParser
 import logging
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Link extraction only needs hrefs, so it runs as a CSS query on selectolax's C parser instead of a soup
+LINK_SELECTOR = 'a[href]'
+ARTICLE_LINK_SELECTOR = 'a[href*="/articles/"]'
+
+
+def link_hrefs(content: bytes, selector: str = LINK_SELECTOR) -> List[str]:
+    """Non-empty href values of the links matching selector."""
+    hrefs = (node.attributes.get('href') for node in HTMLParser(content).css(selector))
+    return [href for href in hrefs if href]
+
+# Elements parse_article reads; everything outside these subtrees is skipped while parsing
+ARTICLE_PART_TAGS = {'h1', 'title', 'article', 'main'}
+ARTICLE_PART_CLASSES = {
+    'article-title', 'article-content', 'article-body', 'article',
+    'breadcrumbs', 'breadcrumb', 'article-tag', 'tag', 'label'
+}
+
+
+def is_article_part(name, attrs=None) -> bool:
+    """SoupStrainer filter for the title, body, breadcrumb and tag elements of an article page."""
+    # Older bs4 passes (name, attrs) while parsing; newer versions pass the tag itself
+    if attrs is None and hasattr(name, 'attrs'):
+        name, attrs = name.name, name.attrs
+    attrs = attrs or {}
+    
+    classes = attrs.get('class', '')
+    if isinstance(classes, str):
+        classes = classes.split()
+    
+    return (
+        name in ARTICLE_PART_TAGS
+        or not ARTICLE_PART_CLASSES.isdisjoint(classes)
+        or (name == 'nav' and 'readcrumb' in attrs.get('aria-label', ''))
+    )
+
+
+ARTICLE_STRAINER = SoupStrainer(is_article_part)
+
+
+def priority_selector(selectors: List[str]) -> tuple:
+    """Compile fallback selectors once: a union for a single tree walk plus each part in priority order."""
+    return soupsieve.compile(', '.join(selectors)), [soupsieve.compile(selector) for selector in selectors]
+
+
+def select_by_priority(soup: BeautifulSoup, selector: tuple):
+    """First element matching the highest-priority selector, found with one walk of the tree."""
+    union, parts = selector
+    candidates = union.select(soup)
+    for part in parts:
+        for candidate in candidates:
+            if part.match(candidate):
+                return candidate
+    return None
+
+
+TITLE_SELECTOR = priority_selector(['h1', 'h2.article-title', 'title'])
+CONTENT_SELECTOR = priority_selector(['.article-content', '.article-body', 'article', '.article', 'main'])
+BREADCRUMB_SELECTOR = soupsieve.compile('nav[aria-label*="readcrumb"], .breadcrumbs, ol.breadcrumb')
+TAG_SELECTOR = soupsieve.compile('.article-tag, .tag, .label')
+
+
+def parse_article_html(content: bytes, url: str) -> Dict[str, Any]:
+    """Extract a help article from its page; a module-level function so it can run in a worker process."""
+    soup = BeautifulSoup(content, 'lxml', parse_only=ARTICLE_STRAINER)
+    
+    # scraped_at stays a datetime; orjson writes it in the same ISO 8601 form as isoformat()
+    article = {
+        "url": url,
+        "scraped_at": datetime.now(timezone.utc)
+    }
+    
+    # Title
+    title_elem = select_by_priority(soup, TITLE_SELECTOR)
+    article["title"] = title_elem.get_text(strip=True) if title_elem else ""
+    
+    # Content
+    content_elem = select_by_priority(soup, CONTENT_SELECTOR)
+    
+    if content_elem:
+        for script in content_elem(['script', 'style']):
+            script.decompose()
+        article["content"] = content_elem.get_text(separator='\n', strip=True)
+    else:
+        article["content"] = ""
+    
+    # Category
+    breadcrumb = BREADCRUMB_SELECTOR.select_one(soup)
+    if breadcrumb:
+        items = breadcrumb.find_all(['li', 'a'])
+        if len(items) > 1:
+            article["category"] = items[-2].get_text(strip=True)
+        else:
+            article["category"] = "General"
+    else:
+        article["category"] = "General"
+    
+    # Tags
+    tags = dict.fromkeys(tag.get_text(strip=True) for tag in TAG_SELECTOR.select(soup))
+    article["tags"] = [tag for tag in tags if tag]
+    
+    return article
+
+# Pages fetched in parallel over the shared cloudscraper session
+MAX_CONCURRENT_FETCHES = 8
+
+# Article pages are parsed in worker processes so parsing never holds the GIL the fetch threads need;
+# workers are spawned rather than forked because the pool starts while fetch threads are running
+MAX_PARSE_WORKERS = os.cpu_count()
+PARSE_CONTEXT = multiprocessing.get_context('spawn')
+
+# Random delay before each request so workers freed together don't hit the server in lockstep
+FETCH_JITTER_SECONDS = (0.05, 0.2)
+
+# Polite delay adapts to the server: none while the last LATENCY_WINDOW responses held no 429/5xx,
+# otherwise the median response time times POLITE_DELAY_FACTOR, capped at MAX_POLITE_DELAY_SECONDS
+LATENCY_WINDOW = 50
+POLITE_DELAY_FACTOR = 1.0
+MAX_POLITE_DELAY_SECONDS = 2.0
+
+# Retries for throttled responses; Retry-After is honoured when the server sends it
+THROTTLE_STATUSES = {429, 503}
+MAX_FETCH_ATTEMPTS = 5
+DEFAULT_BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 60.0
+
 
 class GrammarlyCloudScraper:
     """Scraper for Grammarly help center using cloudscraper."""
@@ -20,8 +155,20 @@ class GrammarlyCloudScraper:
     def __init__(self, base_url: str = "https://support.grammarly.com"):
         self.base_url = base_url
         self.visited_urls = set()
+        # Title, URL and category of each article written so far; full articles go straight to disk
         self.articles = []
         
+        # Listing pages fetched so far; category pages are read for sections and again for articles
+        self._page_cache: Dict[str, bytes] = {}
+        
+        # Shared pause so every worker backs off once the server starts throttling
+        self._backoff_lock = threading.Lock()
+        self._backoff_until = 0.0
+        
+        # Rolling window of recent response times and whether each was a 429/5xx
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._server_errors = deque(maxlen=LATENCY_WINDOW)
+        
         # Create cloudscraper instance
         self.scraper = cloudscraper.create_scraper(
             browser={
@@ -31,15 +178,75 @@ class GrammarlyCloudScraper:
             }
         )
     
-    def fetch_page(self, url: str) -> tuple[str, int]:
-        """Fetch a page using cloudscraper."""
+    def fetch_page(self, url: str, cache: bool = False) -> tuple[bytes, int]:
+        """Fetch a page's raw bytes using cloudscraper, optionally reusing an earlier successful fetch.
+        
+        The parsers decode the bytes from the page's own charset declaration, so requests never
+        has to guess the encoding and decode the body in Python first.
+        """
+        if cache and url in self._page_cache:
+            return self._page_cache[url], 200
+        
+        for attempt in range(MAX_FETCH_ATTEMPTS):
+            self._wait_for_backoff()
+            time.sleep(random.uniform(*FETCH_JITTER_SECONDS) + self._polite_delay())
+            try:
+                logger.info(f"Fetching: {url}")
+                started = time.monotonic()
+                response = self.scraper.get(url, timeout=30)
+            except Exception as e:
+                logger.error(f"Error fetching {url}: {e}")
+                return b"", 0
+            
+            with self._backoff_lock:
+                self._latencies.append(time.monotonic() - started)
+                self._server_errors.append(response.status_code == 429 or response.status_code >= 500)
+            
+            if response.status_code not in THROTTLE_STATUSES:
+                break
+            
+            delay = self._retry_after(response, attempt)
+            logger.warning(f"Throttled ({response.status_code}) on {url}, backing off {delay:.0f}s")
+            with self._backoff_lock:
+                self._backoff_until = max(self._backoff_until, time.monotonic() + delay)
+        
+        if cache and response.status_code == 200:
+            self._page_cache[url] = response.content
+        return response.content, response.status_code
+    
+    def _wait_for_backoff(self):
+        """Sleep until any server-requested backoff has elapsed."""
+        with self._backoff_lock:
+            remaining = self._backoff_until - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+    
+    def _polite_delay(self) -> float:
+        """Extra wait before a request, scaled to recent response times once the server shows strain."""
+        with self._backoff_lock:
+            if not any(self._server_errors):
+                return 0.0
+            return min(median(self._latencies) * POLITE_DELAY_FACTOR, MAX_POLITE_DELAY_SECONDS)
+    
+    @staticmethod
+    def _retry_after(response, attempt: int) -> float:
+        """Seconds to wait after a throttled response."""
         try:
-            logger.info(f"Fetching: {url}")
-            response = self.scraper.get(url, timeout=30)
-            return response.text, response.status_code
-        except Exception as e:
-            logger.error(f"Error fetching {url}: {e}")
-            return "", 0
+            delay = float(response.headers.get('Retry-After', ''))
+        except ValueError:
+            delay = DEFAULT_BACKOFF_SECONDS * 2 ** attempt
+        return min(delay, MAX_BACKOFF_SECONDS)
+    
+    @staticmethod
+    def _normalize_url(url: str) -> str:
+        """Canonical form of a URL so aliases of one article are fetched once.
+        
+        Lowercases the host and drops the fragment, utm_* tracking parameters and any trailing slash.
+        """
+        parts = urlsplit(url)
+        query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                           if not k.startswith('utm_')])
+        return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path.rstrip('/'), query, ''))
     
     def test_access(self):
         """Test if we can access the help center."""
@@ -56,89 +263,43 @@ class GrammarlyCloudScraper:
             if status == 200:
                 logger.info("Successfully bypassed Cloudflare!")
                 return True
-            
-            time.sleep(2)
         
         return False
     
-    def parse_article(self, url: str) -> Dict[str, Any]:
-        """Parse a help article."""
+    def parse_article(self, url: str, parse_pool: Optional[Executor] = None) -> Optional[Dict[str, Any]]:
+        """Fetch and parse a help article, handing the parse to parse_pool when one is given."""
         content, status = self.fetch_page(url)
         
         if status != 200 or not content:
             return None
         
-        soup = BeautifulSoup(content, 'html.parser')
-        
-        article = {
-            "url": url,
-            "scraped_at": datetime.now(timezone.utc).isoformat()
-        }
-        
-        # Title
-        title_elem = soup.find('h1') or soup.find('h2', class_='article-title') or soup.find('title')
-        article["title"] = title_elem.get_text(strip=True) if title_elem else ""
-        
-        # Content
-        content_elem = None
-        for selector in ['.article-content', '.article-body', 'article', '.article', 'main']:
-            content_elem = soup.select_one(selector)
-            if content_elem:
-                break
-        
-        if content_elem:
-            for script in content_elem(['script', 'style']):
-                script.decompose()
-            article["content"] = content_elem.get_text(separator='\n', strip=True)
-        else:
-            article["content"] = ""
-        
-        # Category
-        breadcrumb = soup.select_one('nav[aria-label*="readcrumb"], .breadcrumbs, ol.breadcrumb')
-        if breadcrumb:
-            items = breadcrumb.find_all(['li', 'a'])
-            if len(items) > 1:
-                article["category"] = items[-2].get_text(strip=True)
-            else:
-                article["category"] = "General"
-        else:
-            article["category"] = "General"
-        
-        # Tags
-        tags = []
-        for tag in soup.select('.article-tag, .tag, .label'):
-            tag_text = tag.get_text(strip=True)
-            if tag_text and tag_text not in tags:
-                tags.append(tag_text)
-        article["tags"] = tags
-        
-        return article
+        if parse_pool is None:
+            return parse_article_html(content, url)
+        return parse_pool.submit(parse_article_html, content, url).result()
     
-    def get_article_links(self, page_url: str) -> List[str]:
+    def get_article_links(self, page_url: str) -> Set[str]:
         """Extract article links from a page."""
-        content, status = self.fetch_page(page_url)
+        content, status = self.fetch_page(page_url, cache=True)
         
-        if status != 200:
-            return []
+        if status != 200 or not content:
+            return set()
         
-        soup = BeautifulSoup(content, 'html.parser')
-        links = []
+        links = set()
         
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            if '/articles/' in href or '/hc/en-us/articles/' in href:
-                if href.startswith('/'):
-                    href = self.base_url + href
-                elif not href.startswith('http'):
-                    href = self.base_url + '/' + href
-                
-                if href not in self.visited_urls:
-                    links.append(href)
+        for href in link_hrefs(content, ARTICLE_LINK_SELECTOR):
+            if href.startswith('/'):
+                href = self.base_url + href
+            elif not href.startswith('http'):
+                href = self.base_url + '/' + href
+            
+            href = self._normalize_url(href)
+            if href not in self.visited_urls:
+                links.add(href)
         
         return links
     
-    def scrape_help_center(self, max_articles: int = None):
-        """Scrape the help center."""
+    def scrape_help_center(self, max_articles: int = None, output_dir: str = "../data/scraped"):
+        """Scrape the help center, writing each article to output_dir as soon as it is parsed."""
         # Test access first
         if not self.test_access():
             logger.error("Cannot bypass Cloudflare protection")
@@ -148,58 +309,58 @@ class GrammarlyCloudScraper:
         categories_url = f"{self.base_url}/hc/en-us"
         content, status = self.fetch_page(categories_url)
         
-        article_urls = []
+        article_urls = set()
         
-        if status == 200:
-            soup = BeautifulSoup(content, 'html.parser')
-            
-            # Find category and section links
+        if status == 200 and content:
+            # Find category and section links; the sets make membership checks O(1)
             category_links = []
             section_links = []
+            seen_categories = set()
+            seen_sections = set()
             
-            for link in soup.find_all('a', href=True):
-                href = link['href']
+            for href in link_hrefs(content):
                 if '/categories/' in href:
                     full_url = self.base_url + href if href.startswith('/') else href
-                    if full_url not in category_links:
+                    if full_url not in seen_categories:
+                        seen_categories.add(full_url)
                         category_links.append(full_url)
                 elif '/sections/' in href:
                     full_url = self.base_url + href if href.startswith('/') else href
-                    if full_url not in section_links:
+                    if full_url not in seen_sections:
+                        seen_sections.add(full_url)
                         section_links.append(full_url)
             
             # Also get sections from each category page
-            for category_url in category_links[:]:
-                logger.info(f"Getting sections from category: {category_url}")
-                cat_content, cat_status = self.fetch_page(category_url)
-                if cat_status == 200:
-                    cat_soup = BeautifulSoup(cat_content, 'html.parser')
-                    for link in cat_soup.find_all('a', href=True):
-                        href = link['href']
+            logger.info(f"Getting sections from {len(category_links)} categories...")
+            with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_FETCHES) as executor:
+                category_pages = list(executor.map(lambda u: self.fetch_page(u, cache=True), category_links))
+            
+            for cat_content, cat_status in category_pages:
+                if cat_status == 200 and cat_content:
+                    for href in link_hrefs(cat_content):
                         if '/sections/' in href:
                             full_url = self.base_url + href if href.startswith('/') else href
-                            if full_url not in section_links:
+                            if full_url not in seen_sections:
+                                seen_sections.add(full_url)
                                 section_links.append(full_url)
-                time.sleep(1)
             
-            # Combine all links
+            # Combine all links; categories and sections never share a URL
             all_links = category_links + section_links
-            all_links = list(set(all_links))  # Remove duplicates
             
             logger.info(f"Found {len(category_links)} categories and {len(section_links)} sections")
             
             # Get articles from ALL categories and sections
             logger.info("Collecting articles from all categories and sections...")
-            for i, url in enumerate(all_links):
-                logger.info(f"Processing {i+1}/{len(all_links)}: {url}")
-                links = self.get_article_links(url)
-                logger.info(f"  Found {len(links)} articles")
-                article_urls.extend(links)
-                
-                if max_articles and len(article_urls) >= max_articles:
-                    break
-                
-                time.sleep(2)
+            executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_FETCHES)
+            try:
+                for i, (url, links) in enumerate(zip(all_links, executor.map(self.get_article_links, all_links))):
+                    logger.info(f"Processed {i+1}/{len(all_links)}: {url} ({len(links)} articles)")
+                    article_urls |= links
+                    
+                    if max_articles and len(article_urls) >= max_articles:
+                        break
+            finally:
+                executor.shutdown(cancel_futures=True)
         
         # If no categories, try predefined URLs
         if not article_urls:
@@ -209,72 +370,71 @@ class GrammarlyCloudScraper:
                 f"{self.base_url}/hc/en-us/sections/115001494251-Browser-Extension"
             ]
             
-            for category_url in predefined_categories:
-                links = self.get_article_links(category_url)
-                article_urls.extend(links)
-                time.sleep(2)
+            with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_FETCHES) as executor:
+                for links in executor.map(self.get_article_links, predefined_categories):
+                    article_urls |= links
         
-        # Remove duplicates and optionally limit
-        article_urls = list(set(article_urls))
+        # Optionally limit
+        article_urls = list(article_urls)
         if max_articles:
             article_urls = article_urls[:max_articles]
         
         # Scrape articles
         logger.info(f"Scraping {len(article_urls)} articles...")
         
-        for i, url in enumerate(article_urls):
-            if url not in self.visited_urls:
-                self.visited_urls.add(url)
-                logger.info(f"Scraping article {i+1}/{len(article_urls)}: {url}")
-                
-                article = self.parse_article(url)
+        pending_urls = [url for url in article_urls if url not in self.visited_urls]
+        self.visited_urls.update(pending_urls)
+        
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+        
+        # Articles are written as they finish, so one slow page never holds back the rest,
+        # memory stays flat and an interrupted run keeps everything scraped so far
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_FETCHES) as executor, \
+                ProcessPoolExecutor(max_workers=MAX_PARSE_WORKERS, mp_context=PARSE_CONTEXT) as parse_pool:
+            futures = {executor.submit(self.parse_article, url, parse_pool): url for url in pending_urls}
+            for i, future in enumerate(as_completed(futures)):
+                article = future.result()
+                logger.info(f"Scraped article {i+1}/{len(pending_urls)}: {futures[future]}")
                 if article and article.get("content"):
-                    self.articles.append(article)
+                    self.save_article(output_path, article)
                     logger.info(f"Successfully scraped: {article.get('title', 'No title')}")
-                
-                time.sleep(2)  # Be polite
         
         logger.info(f"Scraped {len(self.articles)} articles successfully")
         return self.articles
     
-    def save_articles(self, output_dir: str = "../data/scraped"):
-        """Save scraped articles to JSON files."""
+    def save_article(self, output_path: Path, article: Dict[str, Any]):
+        """Write one article to the next numbered file and remember its summary entry."""
+        filename = output_path / f"article_{len(self.articles):04d}.json"
+        filename.write_bytes(orjson.dumps(article, option=orjson.OPT_INDENT_2))
+        self.articles.append({
+            "title": article.get("title", ""),
+            "url": article.get("url", ""),
+            "category": article.get("category", "")
+        })
+    
+    def save_summary(self, output_dir: str = "../data/scraped"):
+        """Save the summary of the articles written during the scrape."""
         output_path = Path(output_dir)
         output_path.mkdir(parents=True, exist_ok=True)
         
-        # Save individual articles
-        for i, article in enumerate(self.articles):
-            filename = output_path / f"article_{i:04d}.json"
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(article, f, indent=2, ensure_ascii=False)
-        
-        # Save summary
         summary = {
             "total_articles": len(self.articles),
-            "scraped_at": datetime.now(timezone.utc).isoformat(),
-            "categories": list(set(a.get("category", "") for a in self.articles)),
-            "articles": [
-                {
-                    "title": a.get("title", ""),
-                    "url": a.get("url", ""),
-                    "category": a.get("category", "")
-                }
-                for a in self.articles
-            ]
+            "scraped_at": datetime.now(timezone.utc),
+            "categories": list(set(a["category"] for a in self.articles)),
+            "articles": self.articles
         }
         
-        with open(output_path / "summary.json", 'w', encoding='utf-8') as f:
-            json.dump(summary, f, indent=2, ensure_ascii=False)
+        (output_path / "summary.json").write_bytes(orjson.dumps(summary, option=orjson.OPT_INDENT_2))
         
         logger.info(f"Saved {len(self.articles)} articles to {output_path}")
 
-
 def main():
     """Main function to run the scraper."""
     scraper = GrammarlyCloudScraper()
     # Scrape entire help center (no article limit)
     scraper.scrape_help_center(max_articles=None)
-    scraper.save_articles()
+    scraper.save_summary()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,48 @@
+"""Tests for dataset loading in scripts/evaluate_variants.py."""
+
+import ast
+from pathlib import Path
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+import pyarrow.compute as pc  # noqa: E402
+from pyarrow import csv as pa_csv  # noqa: E402
+
+SCRIPT = Path(__file__).resolve().parent.parent / "scripts" / "evaluate_variants.py"
+
+
+def load_definitions(*names):
+    """Execute just the named module-level definitions of the script.
+
+    The script imports the chatbot through package-relative imports, so it cannot be imported here.
+    """
+    tree = ast.parse(SCRIPT.read_text())
+    nodes = [
+        node for node in tree.body
+        if getattr(node, "name", None) in names
+        or (isinstance(node, ast.Assign) and any(getattr(t, "id", None) in names for t in node.targets))
+    ]
+    namespace = {"Path": Path, "pd": pd, "pa_csv": pa_csv, "pc": pc}
+    exec(compile(ast.Module(body=nodes, type_ignores=[]), str(SCRIPT), "exec"), namespace)
+    return namespace
+
+
+def test_read_test_split_handles_multiline_quoted_cells(tmp_path):
+    read_test_split = load_definitions("DATASET_COLUMNS", "read_test_split")["read_test_split"]
+
+    dataset = tmp_path / "dataset.csv"
+    dataset.write_text(
+        "conversation_id,split,customer_query,intent,ideal_response,extra\n"
+        'a1,test,How do I install?,setup_guide,"Open the store.\n\n[ACTIONS] install",x\n'
+        'a2,train,Refund?,billing_inquiry,"Contact billing.\n\n[ESCALATE]",y\n'
+        'a3,test,What is it?,feature_info,One line,z\n'
+    )
+
+    df = read_test_split(dataset)
+
+    assert df["conversation_id"].tolist() == ["a1", "a3"]
+    assert df["ideal_response"].tolist() == ["Open the store.\n\n[ACTIONS] install", "One line"]
+    assert "extra" not in df.columns
@@ -0,0 +1,61 @@
+"""Tests for the article chunking in scripts/prepare_dicl_data.py."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+for module in ("numpy", "orjson", "tiktoken", "dotenv", "openai", "tenacity"):
+    pytest.importorskip(module)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from prepare_dicl_data import DICLDataPreparer, token_windows  # noqa: E402
+
+
+def test_short_tail_extends_last_window():
+    # 876 tokens: a clamped tail window would start at 376, one token after the window at 375
+    assert token_windows(876, window=500, stride=375) == [(0, 500), (375, 876)]
+
+
+def test_long_tail_gets_its_own_window():
+    assert token_windows(1000, window=500, stride=375) == [(0, 500), (375, 875), (500, 1000)]
+
+
+def test_empty_content_has_no_windows():
+    assert token_windows(0, window=500, stride=375) == []
+
+
+def test_short_article_is_one_window():
+    assert token_windows(300, window=500, stride=375) == [(0, 500)]
+
+
+@pytest.mark.parametrize("n_tokens", [1, 499, 500, 501, 875, 876, 1000, 1250, 2000, 5003])
+def test_windows_cover_every_token_without_near_duplicates(n_tokens):
+    windows = token_windows(n_tokens, window=500, stride=375)
+    assert windows[0][0] == 0
+    assert windows[-1][1] >= n_tokens
+    for (start, end), (next_start, _) in zip(windows, windows[1:]):
+        assert next_start <= end
+        assert next_start - start >= 125
+
+
+def paragraph_chunks(content, chunk_size):
+    # create_article_chunks uses no instance state, so skip __init__ and its API client
+    preparer = DICLDataPreparer.__new__(DICLDataPreparer)
+    article = {'title': 'T', 'category': 'C', 'url': 'u', 'content': content}
+    return [chunk['text'].split('\n\n', 1)[1] for chunk in preparer.create_article_chunks([article], chunk_size)]
+
+
+def test_paragraph_chunks_bound_real_word_count():
+    # Words separated by newlines, as scraped content is; a space count would see one word per paragraph
+    paragraphs = ['\n'.join(['word'] * 40) for _ in range(10)]
+    chunks = paragraph_chunks('\n\n'.join(paragraphs), chunk_size=100)
+    assert [len(chunk.split()) for chunk in chunks] == [80] * 5
+
+
+def test_paragraph_chunks_pack_greedily():
+    sizes = [30, 50, 30, 120, 10, 10]
+    content = '\n\n'.join(' '.join(['w'] * size) for size in sizes)
+    chunks = paragraph_chunks(content, chunk_size=100)
+    assert [len(chunk.split()) for chunk in chunks] == [80, 30, 120, 20]